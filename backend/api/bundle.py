@@ -0,0 +1,155 @@
+"""
+Precompiled timetable bundle for client-side and offline routing.
+
+The whole network is written as one compact JSON file laid out like the
+in-process snapshot (api.timetable): flat integer arrays of stop stations and
+times grouped per train. The file name carries a hash of its content, so it
+can be served with an immutable cache policy; gzip (and brotli, when the
+``brotli`` package is installed) variants are written next to it.
+``manifest.json`` in the same directory points to the current bundle and is
+what /api/timetable/bundle/ returns. Bundles are served by a view
+(/api/timetable/bundles/<name>), not as static files, so one written by an
+import is available at once, without restarting the server.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from django.conf import settings
+
+from .dataset import get_dataset_version
+from .timetable import Timetable
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is written without it
+    brotli = None
+
+BUNDLE_FORMAT = 1
+BUNDLE_PREFIX = 'timetable'
+MANIFEST_NAME = 'manifest.json'
+BUNDLE_NAME = re.compile(rf'{BUNDLE_PREFIX}\.[0-9a-f]{{12}}\.json')
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def get_bundle_root():
+    """Directory the bundles are written to (settings.TIMETABLE_BUNDLE_ROOT)"""
+    return str(getattr(settings, 'TIMETABLE_BUNDLE_ROOT', os.path.join(settings.BASE_DIR, 'bundles')))
+
+
+def get_bundle_url():
+    """URL prefix the bundle directory is served under (settings.TIMETABLE_BUNDLE_URL)"""
+    return getattr(settings, 'TIMETABLE_BUNDLE_URL', '/api/timetable/bundles/')
+
+
+def compile_bundle(timetable):
+    """
+    Bundle payload for a Timetable.
+
+    Stations and trains are addressed by position. The stops of train ``t``
+    are ``train_first_stop[t]:train_first_stop[t + 1]`` of ``stop_station``
+    (station positions) and ``stop_time`` (minutes since midnight, -1 when
+    the stop has no time).
+    """
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': timetable.version,
+        'stations': [
+            [station_id, name_fr, name_ar, latitude, longitude]
+            for station_id, name_fr, name_ar, latitude, longitude in zip(
+                timetable.station_ids, timetable.station_name_fr, timetable.station_name_ar,
+                timetable.station_latitude, timetable.station_longitude
+            )
+        ],
+        'trains': [
+            [train_id, number, route_name, days_operational, operating_days]
+            for train_id, number, route_name, days_operational, operating_days in zip(
+                timetable.train_ids, timetable.train_number, timetable.train_route_name,
+                timetable.train_days_operational, timetable.train_operating_days
+            )
+        ],
+        'train_first_stop': list(timetable.train_first_stop),
+        'stop_station': list(timetable.stop_station),
+        'stop_time': list(timetable.stop_time),
+    }
+
+
+def write_bundle(timetable=None):
+    """
+    Compile the current timetable and write the bundle, its compressed
+    variants and the manifest; returns the manifest dict.
+
+    Older bundles are left in place for clients still holding their URL.
+    """
+    if timetable is None:
+        timetable = Timetable.from_database(version=get_dataset_version())
+
+    content = json.dumps(compile_bundle(timetable), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(content).hexdigest()
+    name = f"{BUNDLE_PREFIX}.{digest[:12]}.json"
+
+    root = get_bundle_root()
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': timetable.version,
+        'url': get_bundle_url() + name,
+        'sha256': digest,
+        'size': len(content),
+    }
+
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    with open(path + '.gz', 'wb') as f:
+        f.write(compressed)
+    manifest['gzip_size'] = len(compressed)
+
+    if brotli is not None:
+        compressed = brotli.compress(content)
+        with open(path + '.br', 'wb') as f:
+            f.write(compressed)
+        manifest['brotli_size'] = len(compressed)
+
+    # Write the manifest last, atomically, so it never points to a partial bundle
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    return manifest
+
+
+def read_manifest():
+    """The manifest of the latest written bundle, or None if none was built"""
+    try:
+        with open(os.path.join(get_bundle_root(), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_bundle(name, accepted_encodings=()):
+    """
+    Open a written bundle by file name, preferring a compressed variant in
+    ``accepted_encodings``; returns (file, content encoding or None), or
+    None for an unknown name.
+    """
+    if not BUNDLE_NAME.fullmatch(name):
+        return None
+    path = os.path.join(get_bundle_root(), name)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted_encodings:
+            try:
+                return open(path + suffix, 'rb'), encoding
+            except OSError:
+                continue
+    try:
+        return open(path, 'rb'), None
+    except OSError:
+        return None
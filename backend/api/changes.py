@@ -0,0 +1,162 @@
+"""
+Timetable change log for delta sync (GET /api/timetable/changes/).
+
+Each published dataset version stores a fingerprint of every station and
+train record; the next import diffs against it and logs what was added,
+modified or removed (TimetableChange). Trains are keyed by number because
+imports delete and recreate them with new ids. Only the last
+TIMETABLE_CHANGE_RETENTION versions keep their log; clients older than that
+are told to resync from the full bundle (api.bundle).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import DatasetVersion, TimetableChange
+
+KINDS = ('station', 'train')
+
+
+def get_change_retention():
+    """Versions whose change log is kept (settings.TIMETABLE_CHANGE_RETENTION)"""
+    return max(1, getattr(settings, 'TIMETABLE_CHANGE_RETENTION', 30))
+
+
+def station_records(timetable):
+    """Station records keyed by id, in the bundle's station layout"""
+    return {
+        str(station_id): [station_id, name_fr, name_ar, latitude, longitude]
+        for station_id, name_fr, name_ar, latitude, longitude in zip(
+            timetable.station_ids, timetable.station_name_fr, timetable.station_name_ar,
+            timetable.station_latitude, timetable.station_longitude
+        )
+    }
+
+
+def train_records(timetable):
+    """
+    Train records keyed by train number. Stops are [station id, minutes]
+    pairs (-1 when the stop has no time); a number shared by several trains
+    gets a '#2', '#3'... suffix in id order.
+    """
+    records = {}
+    for train, train_id in enumerate(timetable.train_ids):
+        number = timetable.train_number[train]
+        key = number
+        duplicate = 1
+        while key in records:
+            duplicate += 1
+            key = f"{number}#{duplicate}"
+        records[key] = {
+            'id': train_id,
+            'number': number,
+            'route_name': timetable.train_route_name[train],
+            'days_operational': timetable.train_days_operational[train],
+            'operating_days': timetable.train_operating_days[train],
+            'stops': [
+                [timetable.station_ids[timetable.stop_station[stop]], timetable.stop_time[stop]]
+                for stop in timetable.train_stops(train)
+            ],
+        }
+    return records
+
+
+def fingerprint(record):
+    """Short content hash of a record; train ids are left out since every import changes them"""
+    if isinstance(record, dict):
+        record = {name: value for name, value in record.items() if name != 'id'}
+    content = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+def record_changes(version, timetable):
+    """
+    Log the differences between ``version`` (a DatasetVersion whose data is
+    ``timetable``) and the previous fingerprinted version, then compact the
+    log; returns the number of changes recorded.
+    """
+    records = {'station': station_records(timetable), 'train': train_records(timetable)}
+    fingerprints = {
+        kind: {key: fingerprint(record) for key, record in records[kind].items()}
+        for kind in KINDS
+    }
+
+    previous = DatasetVersion.objects.filter(
+        id__lt=version.id, fingerprints__isnull=False
+    ).order_by('-id').first()
+
+    changes = []
+    if previous is not None:
+        for kind in KINDS:
+            old, new = previous.fingerprints.get(kind, {}), fingerprints[kind]
+            for key, digest in new.items():
+                if key not in old:
+                    action = 'added'
+                elif old[key] != digest:
+                    action = 'modified'
+                else:
+                    continue
+                changes.append(TimetableChange(
+                    version=version, kind=kind, key=key, action=action, record=records[kind][key]
+                ))
+            changes.extend(
+                TimetableChange(version=version, kind=kind, key=key, action='removed')
+                for key in old.keys() - new.keys()
+            )
+        TimetableChange.objects.bulk_create(changes, batch_size=500)
+
+    # Only the latest version's fingerprints are needed for the next diff
+    DatasetVersion.objects.filter(id__lt=version.id, fingerprints__isnull=False).update(fingerprints=None)
+    version.fingerprints = fingerprints
+    version.changes_logged = previous is not None
+    version.save(update_fields=['fingerprints', 'changes_logged'])
+
+    compact_changes(version.id)
+    return len(changes)
+
+
+def compact_changes(current_version):
+    """Drop the change log of versions older than the retention window"""
+    cutoff = current_version - get_change_retention()
+    TimetableChange.objects.filter(version_id__lte=cutoff).delete()
+    DatasetVersion.objects.filter(id__lte=cutoff, changes_logged=True).update(changes_logged=False)
+
+
+def get_changes(since):
+    """
+    Net changes from dataset version ``since`` to the current one.
+
+    Returns a dict with the current 'version' and either 'full_resync':
+    True (the log no longer reaches back to ``since``, or ``since`` is
+    unknown) or, per kind, the 'added' and 'modified' records and the
+    'removed' keys (station ids, train numbers).
+    """
+    current = DatasetVersion.objects.aggregate(latest=Max('id'))['latest'] or 0
+    result = {'version': current, 'since': since}
+
+    if since > current or DatasetVersion.objects.filter(id__gt=since, changes_logged=False).exists():
+        result['full_resync'] = True
+        return result
+
+    # Fold every version's changes into one net change per record
+    net = {}
+    for kind, key, action, record in TimetableChange.objects.filter(
+        version_id__gt=since, version_id__lte=current
+    ).order_by('version_id', 'id').values_list('kind', 'key', 'action', 'record'):
+        existed_before = net[kind, key][0] if (kind, key) in net else action != 'added'
+        net[kind, key] = (existed_before, action != 'removed', record)
+
+    result['full_resync'] = False
+    for kind in KINDS:
+        result[f'{kind}s'] = {'added': [], 'modified': [], 'removed': []}
+    for (kind, key), (existed_before, exists_after, record) in net.items():
+        changes = result[f'{kind}s']
+        if existed_before and exists_after:
+            changes['modified'].append(record)
+        elif exists_after:
+            changes['added'].append(record)
+        elif existed_before:
+            changes['removed'].append(int(key) if kind == 'station' else key)
+    return result
@@ -0,0 +1,44 @@
+"""
+Conditional GET for the read endpoints.
+
+Their responses only change when a new dataset version is published, so the
+ETag is the version plus a hash of what else the response depends on: the
+path, the query parameters, the Accept header and, for parameters that
+default to the current day or time, the value they would default to. A
+matching If-None-Match is answered with 304 before the view runs, so a
+revalidation costs the memoized version lookup (api.dataset) and no query,
+search or serialization.
+"""
+import hashlib
+from datetime import datetime
+
+from django.views.decorators.http import condition
+
+from .dataset import get_dataset_version
+from .timetable import day_number
+
+
+def dataset_etag(request, now=()):
+    """
+    Strong ETag of a read request. ``now`` names the query parameters the
+    view fills with the current time ('time', HH:MM) or day ('day') when
+    they are missing.
+    """
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    current = datetime.now()
+    if 'time' in now and not request.GET.get('time'):
+        params.append(('now:time', current.strftime('%H:%M')))
+    if 'day' in now and not request.GET.get('day'):
+        params.append(('now:day', day_number(current)))
+
+    content = repr((request.path, params, request.META.get('HTTP_ACCEPT', '')))
+    return f"v{get_dataset_version()}-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]}"
+
+
+def dataset_condition(now=()):
+    """
+    View decorator adding the dataset ETag and 304 handling (django's
+    ``condition``); works on function views under @api_view and on viewset
+    methods through ``method_decorator``.
+    """
+    return condition(etag_func=lambda request, *args, **kwargs: dataset_etag(request, now))
@@ -0,0 +1,173 @@
+"""
+Connection Scan Algorithm (CSA) over the compiled timetable snapshot.
+
+Every pair of consecutive stops of a train is one elementary connection.
+Connections are kept in a single array sorted by departure time, so an
+earliest-arrival query with any number of transfers is one linear scan.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .timetable import NO_TIME, MINUTES_PER_DAY
+
+INFINITY = 1 << 30
+
+
+def get_min_transfer_minutes():
+    """Minimum time needed to change trains (settings.MIN_TRANSFER_MINUTES)"""
+    return getattr(settings, 'MIN_TRANSFER_MINUTES', 10)
+
+
+class ConnectionScan:
+    """
+    Elementary connections of a Timetable, sorted by departure time.
+
+    Times are continuous minutes for the service day: a train running past
+    midnight keeps counting (e.g. 00:15 becomes 1455) so connections of one
+    train never go backwards in time.
+    """
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        connections = []
+        stop_time = timetable.stop_time
+        for train in range(len(timetable.train_ids)):
+            previous_stop = None
+            previous_time = NO_TIME
+            offset = 0
+            for stop in timetable.train_stops(train):
+                time = stop_time[stop]
+                if time == NO_TIME:
+                    continue
+                time += offset
+                if previous_stop is not None and time < previous_time:
+                    offset += MINUTES_PER_DAY
+                    time += MINUTES_PER_DAY
+                if previous_stop is not None:
+                    connections.append((previous_time, time, previous_stop, stop))
+                previous_stop = stop
+                previous_time = time
+        connections.sort()
+
+        self.dep_time = array('l', (c[0] for c in connections))
+        self.arr_time = array('l', (c[1] for c in connections))
+        self.dep_stop = array('l', (c[2] for c in connections))
+        self.arr_stop = array('l', (c[3] for c in connections))
+        self.dep_station = array('l', (timetable.stop_station[c[2]] for c in connections))
+        self.arr_station = array('l', (timetable.stop_station[c[3]] for c in connections))
+        self.train = array('l', (timetable.stop_train[c[2]] for c in connections))
+
+    def __len__(self):
+        return len(self.dep_time)
+
+    def scan(self, origin, departure, min_transfer=None, allowed_days=None, target=None, max_arrival=None):
+        """
+        Run one earliest-arrival scan from ``origin`` leaving at ``departure``.
+
+        Returns ``(arrival, transfers, legs_in)`` indexed by station:
+        earliest arrival minute, number of transfers used to get there, and
+        the ``(boarding, alighting)`` connection pair of the last leg.
+        The scan stops early once ``target`` is settled or ``max_arrival``
+        is passed.
+        """
+        if min_transfer is None:
+            min_transfer = get_min_transfer_minutes()
+        n_stations = len(self.timetable.station_ids)
+        arrival = [INFINITY] * n_stations
+        transfers = [0] * n_stations
+        legs_in = [None] * n_stations
+        arrival[origin] = departure
+
+        boarded = {}  # train -> (boarding connection, transfers so far)
+        operating_days = self.timetable.train_operating_days
+        dep_time, arr_time = self.dep_time, self.arr_time
+        dep_station, arr_station, trains = self.dep_station, self.arr_station, self.train
+
+        for c in range(bisect_left(dep_time, departure), len(dep_time)):
+            time = dep_time[c]
+            if target is not None and arrival[target] <= time:
+                break
+            if max_arrival is not None and time > max_arrival:
+                break
+
+            train = trains[c]
+            boarding = boarded.get(train)
+            if boarding is None:
+                if allowed_days is not None and operating_days[train] not in allowed_days:
+                    continue
+                station = dep_station[c]
+                buffer = 0 if station == origin else min_transfer
+                if arrival[station] + buffer > time:
+                    continue
+                changes = transfers[station] + (0 if station == origin else 1)
+                boarding = (c, changes)
+                boarded[train] = boarding
+
+            station = arr_station[c]
+            if arr_time[c] < arrival[station]:
+                arrival[station] = arr_time[c]
+                transfers[station] = boarding[1]
+                legs_in[station] = (boarding[0], c)
+
+        return arrival, transfers, legs_in
+
+    def extract_legs(self, origin, destination, legs_in):
+        """Walk the leg pointers back from destination; returns [(boarding, alighting), ...]"""
+        legs = []
+        station = destination
+        while station != origin:
+            leg = legs_in[station]
+            if leg is None:
+                return []
+            legs.append(leg)
+            station = self.dep_station[leg[0]]
+        legs.reverse()
+        return legs
+
+    def earliest_arrival(self, origin, destination, departure, min_transfer=None, allowed_days=None):
+        """Legs of the earliest-arriving journey leaving origin at or after departure"""
+        if origin == destination:
+            return []
+        arrival, _, legs_in = self.scan(
+            origin, departure, min_transfer=min_transfer, allowed_days=allowed_days, target=destination
+        )
+        if arrival[destination] >= INFINITY:
+            return []
+        return self.extract_legs(origin, destination, legs_in)
+
+    def journeys(self, origin, destination, departure, count, min_transfer=None, allowed_days=None):
+        """
+        Up to ``count`` successive earliest-arrival journeys.
+
+        After each journey the query is repeated from one minute after its
+        departure, so the result lists distinct departures in time order.
+        """
+        results = []
+        while len(results) < count:
+            legs = self.earliest_arrival(
+                origin, destination, departure, min_transfer=min_transfer, allowed_days=allowed_days
+            )
+            if not legs:
+                break
+            results.append(legs)
+            departure = self.dep_time[legs[0][0]] + 1
+        return results
+
+
+_scan = None
+_scan_lock = threading.Lock()
+
+
+def get_connection_scan(timetable):
+    """Return the ConnectionScan for a timetable snapshot (the last one built is kept)"""
+    global _scan
+    scan = _scan
+    if scan is None or scan.timetable is not timetable:
+        with _scan_lock:
+            if _scan is None or _scan.timetable is not timetable:
+                _scan = ConnectionScan(timetable)
+            scan = _scan
+    return scan
@@ -0,0 +1,77 @@
+"""
+Dataset version stamp (the DatasetVersion table).
+
+Every timetable import ends by publishing a new version; anything derived
+from the timetable (the in-process snapshot, cached search results) is keyed
+on it, so an import invalidates them without having to reach every worker.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import DatasetVersion
+
+_version = None
+_checked_at = 0.0
+_version_lock = threading.Lock()
+
+
+def get_dataset_version_ttl():
+    """Seconds a worker trusts its last version lookup (settings.DATASET_VERSION_TTL)"""
+    return getattr(settings, 'DATASET_VERSION_TTL', 5)
+
+
+def get_dataset_version():
+    """
+    Current dataset version (0 before the first published import).
+
+    The lookup is memoized per process for DATASET_VERSION_TTL seconds, so
+    at most one small query per worker per interval hits the database.
+    """
+    global _version, _checked_at
+    now = time.monotonic()
+    if _version is None or now - _checked_at >= get_dataset_version_ttl():
+        with _version_lock:
+            if _version is None or now - _checked_at >= get_dataset_version_ttl():
+                latest = DatasetVersion.objects.order_by('-id').values_list('id', flat=True).first()
+                _version = latest or 0
+                _checked_at = now
+    return _version
+
+
+def bump_dataset_version(description=''):
+    """Publish a new dataset version; returns the DatasetVersion row"""
+    global _version, _checked_at
+    version = DatasetVersion.objects.create(description=description[:200])
+    with _version_lock:
+        _version = version.id
+        _checked_at = time.monotonic()
+    return version
+
+
+def reset_dataset_version():
+    """Forget the memoized version so the next lookup queries the database"""
+    global _version
+    with _version_lock:
+        _version = None
+
+
+def per_dataset_version(build):
+    """
+    Getter of a process-wide value made by ``build(version)`` on first use
+    and again whenever a newer dataset version has been published.
+    """
+    state = {'version': None, 'value': None}
+    lock = threading.Lock()
+
+    def get():
+        version = get_dataset_version()
+        if state['version'] != version:
+            with lock:
+                if state['version'] != version:
+                    state['value'] = build(version)
+                    state['version'] = version
+        return state['value']
+
+    return get
@@ -0,0 +1,344 @@
+"""
+Prometheus metrics (GET /metrics).
+
+MetricsMiddleware times every API request and counts its database queries
+per endpoint; searches count their outcome and the caches (search results,
+timetable snapshot, HTTP revalidation) their hits and misses. Values are
+kept in process. With METRICS_MULTIPROCESS_DIR set (several gunicorn
+workers), every process also writes its values to a file in that directory
+every METRICS_FLUSH_INTERVAL seconds from a background thread, and once
+more when it exits; /metrics adds up the files of all processes, so
+whichever worker answers the scrape reports the whole server, idle ones
+included. Empty the directory whenever the server starts.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .models import DatasetVersion
+from .profiling import install_query_hook
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Path prefix -> endpoint label; requests outside /api/ are not measured
+ENDPOINTS = (
+    ('/api/search/', 'search'),
+    ('/api/stations/', 'stations'),
+    ('/api/lines/', 'lines'),
+    ('/api/reachability/', 'reachability'),
+    ('/api/timetable/', 'timetable'),
+    ('/api/', 'other'),
+)
+
+_lock = threading.Lock()
+_metrics = []
+# Query counter of the current API request ([count]), None outside one
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def get_multiprocess_dir():
+    """Directory shared by the worker processes (settings.METRICS_MULTIPROCESS_DIR), or None"""
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', '') or None
+
+
+def get_flush_interval():
+    """Seconds between writes of a process's metrics file (settings.METRICS_FLUSH_INTERVAL)"""
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family; values are kept per tuple of label values"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _metrics.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def merge(self, current, value):
+        return current + value
+
+    def samples(self, key, value):
+        yield f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge of a value that only grows; processes are merged by taking the largest"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def merge(self, current, value):
+        return max(current, value)
+
+
+class Histogram(Metric):
+    """Histogram; a value is a list of per-bucket counts (the last one +Inf), then the sum"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def merge(self, current, value):
+        return [a + b for a, b in zip(current, value)]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value):
+            cumulative += count
+            labels = format_labels(self.labelnames, key, [('le', format_value(float(bound)))])
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        labels = format_labels(self.labelnames, key)
+        yield f'{self.name}_sum{labels} {format_value(value[-1])}'
+        yield f'{self.name}_count{labels} {cumulative}'
+
+
+REQUEST_DURATION = Histogram(
+    'traindz_request_duration_seconds', 'API request latency by endpoint.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), labelnames=('endpoint',)
+)
+REQUEST_QUERIES = Histogram(
+    'traindz_request_db_queries', 'SQL queries per API request by endpoint.',
+    (0, 1, 2, 3, 5, 10, 20, 50, 100), labelnames=('endpoint',)
+)
+SEARCH_OUTCOMES = Counter(
+    'traindz_search_outcomes_total', 'Searches by outcome (direct_only, with_connections, empty).',
+    labelnames=('outcome',)
+)
+CACHE_REQUESTS = Counter(
+    'traindz_cache_requests_total', 'Cache lookups by cache and result (hit, miss).',
+    labelnames=('cache', 'result')
+)
+DATASET_VERSION = Gauge('traindz_dataset_version', 'Current dataset version.')
+DATASET_BUILD_TIME = Gauge(
+    'traindz_dataset_build_timestamp_seconds', 'Publication time of the current dataset version (Unix time).'
+)
+
+
+def endpoint_of(path):
+    for prefix, endpoint in ENDPOINTS:
+        if path.startswith(prefix):
+            return endpoint
+    return None
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def record_search_outcome(results):
+    """Count one search by its serialized results"""
+    if not results:
+        outcome = 'empty'
+    elif all(result.get('type') == 'direct' for result in results):
+        outcome = 'direct_only'
+    else:
+        outcome = 'with_connections'
+    SEARCH_OUTCOMES.inc(outcome=outcome)
+
+
+def snapshot():
+    """This process's values as JSON-friendly {metric name: [[label values, value], ...]}"""
+    with _lock:
+        return {
+            metric.name: [[list(key), list(value) if isinstance(value, list) else value]
+                          for key, value in metric.values.items()]
+            for metric in _metrics
+        }
+
+
+_flush_lock = threading.Lock()
+_flusher_pid = None
+
+
+def flush():
+    """Write this process's metrics file (multiprocess mode)"""
+    directory = get_multiprocess_dir()
+    if directory is None:
+        return
+    with _flush_lock:
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+
+def flush_periodically():
+    while True:
+        time.sleep(get_flush_interval())
+        flush()
+
+
+def start_flusher():
+    """Start this process's flush thread (multiprocess mode); again in a forked worker"""
+    global _flusher_pid
+    if get_multiprocess_dir() is None or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True).start()
+    atexit.register(flush)
+
+
+def collect():
+    """Values of every metric, {name: {label values: value}}, summed over processes in multiprocess mode"""
+    snapshots = [snapshot()]
+    directory = get_multiprocess_dir()
+    if directory is not None:
+        own = f'metrics-{os.getpid()}.json'
+        for name in os.listdir(directory):
+            if name == own or not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Removed or unreadable
+        flush()
+
+    by_name = {metric.name: metric for metric in _metrics}
+    totals = {name: {} for name in by_name}
+    for values in snapshots:
+        for name, entries in values.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            for key, value in entries:
+                key = tuple(key)
+                current = totals[name].get(key)
+                totals[name][key] = value if current is None else metric.merge(current, value)
+    return totals
+
+
+def render_metrics():
+    """Prometheus text exposition of all metrics"""
+    latest = DatasetVersion.objects.order_by('-id').values_list('id', 'created_at').first()
+    if latest is not None:
+        DATASET_VERSION.set(latest[0])
+        DATASET_BUILD_TIME.set(latest[1].timestamp())
+
+    totals = collect()
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for key, value in sorted(totals[metric.name].items()):
+            lines.extend(metric.samples(key, value))
+    return '\n'.join(lines) + '\n'
+
+
+def count_query(execute, sql, params, many, context):
+    """Query hook counting the queries of the current API request"""
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Request latency and query count per API endpoint, and HTTP revalidation
+    hits (304 answers to If-None-Match); works under WSGI and ASGI. Queries
+    made on threads that do not inherit the request's context (parallel
+    connection legs, batch searches) are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_query_hook(count_query, 'api.metrics')
+        start_flusher()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        endpoint = endpoint_of(request.path)
+        if endpoint is None:
+            return self.get_response(request)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        return self.observe(request, response, endpoint, time.perf_counter() - start, queries[0])
+
+    async def __acall__(self, request):
+        endpoint = endpoint_of(request.path)
+        if endpoint is None:
+            return await self.get_response(request)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        return self.observe(request, response, endpoint, time.perf_counter() - start, queries[0])
+
+    def observe(self, request, response, endpoint, seconds, queries):
+        REQUEST_DURATION.observe(seconds, endpoint=endpoint)
+        REQUEST_QUERIES.observe(queries, endpoint=endpoint)
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            record_cache('http', response.status_code == 304)
+        start_flusher()  # Workers forked after the middleware was built
+        return response
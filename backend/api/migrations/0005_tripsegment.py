@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_connection_station_latitude_station_line_connections_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_sequence', models.IntegerField()),
+                ('destination_sequence', models.IntegerField()),
+                ('departure_minutes', models.IntegerField()),
+                ('arrival_minutes', models.IntegerField()),
+                ('operating_days', models.CharField(choices=[('daily', 'Daily [*]'), ('no_friday', 'No Friday [1]'), ('friday_only', 'Friday Only [2]')], default='daily', max_length=20)),
+                ('destination_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments_to', to='api.station')),
+                ('origin_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments_from', to='api.station')),
+                ('train', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='api.train')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['origin_station', 'destination_station', 'departure_minutes'], name='api_tripseg_origin__8553a3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_datasetversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetversion',
+            name='changes_logged',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='datasetversion',
+            name='fingerprints',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TimetableChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('station', 'Station'), ('train', 'Train')], max_length=10)),
+                ('key', models.CharField(max_length=100)),
+                ('action', models.CharField(choices=[('added', 'Added'), ('modified', 'Modified'), ('removed', 'Removed')], max_length=10)),
+                ('record', models.JSONField(blank=True, null=True)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='api.datasetversion')),
+            ],
+        ),
+    ]
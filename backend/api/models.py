@@ -70,3 +70,62 @@ class Connection(models.Model):
         indexes = [
             models.Index(fields=['from_station', 'to_station']),
         ]
+
+class TripSegment(models.Model):
+    """
+    Derived index: one row per (train, origin stop, later destination stop).
+    Rebuilt from Stop after each import by api.segments.rebuild_trip_segments().
+    """
+    train = models.ForeignKey(Train, related_name='segments', on_delete=models.CASCADE)
+    origin_station = models.ForeignKey(Station, related_name='segments_from', on_delete=models.CASCADE)
+    destination_station = models.ForeignKey(Station, related_name='segments_to', on_delete=models.CASCADE)
+    origin_sequence = models.IntegerField()
+    destination_sequence = models.IntegerField()
+    departure_minutes = models.IntegerField() # Minutes since midnight at origin
+    arrival_minutes = models.IntegerField() # Minutes since midnight at destination
+    operating_days = models.CharField(max_length=20, choices=Train.OPERATING_DAYS_CHOICES, default='daily')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['origin_station', 'destination_station', 'departure_minutes']),
+        ]
+
+    def __str__(self):
+        return f"{self.train} {self.origin_station_id} -> {self.destination_station_id} ({self.departure_minutes})"
+
+class DatasetVersion(models.Model):
+    """
+    One row per published timetable import. The latest id is the current
+    dataset version; caches and the timetable snapshot are keyed on it.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    description = models.CharField(max_length=200, blank=True) # e.g., "update_db.py"
+    fingerprints = models.JSONField(null=True, blank=True) # Record hashes, kept on the latest version only
+    changes_logged = models.BooleanField(default=False) # True while its TimetableChange rows are retained
+
+    def __str__(self):
+        return f"Dataset v{self.id} ({self.created_at:%Y-%m-%d %H:%M})"
+
+class TimetableChange(models.Model):
+    """
+    Change log between a dataset version and the one before it, recorded by
+    api.changes.record_changes() and compacted after TIMETABLE_CHANGE_RETENTION versions.
+    """
+    KIND_CHOICES = [
+        ('station', 'Station'),
+        ('train', 'Train'),
+    ]
+    ACTION_CHOICES = [
+        ('added', 'Added'),
+        ('modified', 'Modified'),
+        ('removed', 'Removed'),
+    ]
+
+    version = models.ForeignKey(DatasetVersion, related_name='changes', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100) # Station id or train number (train ids change on every import)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    record = models.JSONField(null=True, blank=True) # New state; None when removed
+
+    def __str__(self):
+        return f"v{self.version_id} {self.action} {self.kind} {self.key}"
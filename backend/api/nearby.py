@@ -0,0 +1,77 @@
+"""
+Nearest-station lookup (/api/stations/nearby/).
+
+Stations with coordinates are bucketed in a fixed grid of CELL_DEGREES
+cells, built once per dataset version. A query only measures the
+great-circle (haversine) distance to stations in the cells overlapping the
+search radius.
+"""
+import math
+
+from .dataset import per_dataset_version
+from .models import Station
+
+EARTH_RADIUS_KM = 6371.0
+# Grid cell size (about 11 km north-south)
+CELL_DEGREES = 0.1
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULT_NEARBY_KM = 5
+MAX_NEARBY_KM = 50
+DEFAULT_NEARBY = 5
+MAX_NEARBY = 20
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between two points in degrees"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def cell_of(latitude, longitude):
+    return math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)
+
+
+class StationGrid:
+    """
+    Grid index over station coordinates.
+
+    ``stations`` are (id, name_fr, name_ar, latitude, longitude) tuples;
+    stations without coordinates are left out.
+    """
+
+    def __init__(self, stations, version=0):
+        self.version = version
+        self.cells = {}
+        for station in stations:
+            latitude, longitude = station[3], station[4]
+            if latitude is None or longitude is None:
+                continue
+            self.cells.setdefault(cell_of(latitude, longitude), []).append(station)
+
+    def nearby(self, latitude, longitude, radius_km=DEFAULT_NEARBY_KM, limit=DEFAULT_NEARBY):
+        """Stations within ``radius_km`` as (distance km, station tuple), nearest first"""
+        # Cells overlapping the bounding box of the radius (wider in longitude away from the equator)
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_col = cell_of(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = cell_of(latitude + lat_span, longitude + lon_span)
+
+        found = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for station in self.cells.get((row, col), ()):
+                    distance = haversine_km(latitude, longitude, station[3], station[4])
+                    if distance <= radius_km:
+                        found.append((distance, station))
+        found.sort(key=lambda item: item[0])
+        return found[:limit]
+
+
+# Process-wide grid, rebuilt whenever a newer dataset version is published
+get_station_grid = per_dataset_version(
+    lambda version: StationGrid(
+        Station.objects.values_list('id', 'name_fr', 'name_ar', 'latitude', 'longitude'), version=version
+    )
+)
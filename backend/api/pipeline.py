@@ -0,0 +1,54 @@
+"""
+Post-import pipeline shared by the scripts in backend/scripts.
+
+Rebuilds the tables derived from Train/Stop and then publishes a new dataset
+version, which invalidates cached search results and timetable snapshots, logs
+what changed since the previous version (api.changes) and writes the matching
+timetable bundle (api.bundle).
+"""
+from django.db import transaction
+
+from .bundle import write_bundle
+from .changes import record_changes
+from .dataset import bump_dataset_version
+from .segments import rebuild_trip_segments
+from .timetable import Timetable
+from .transfers import build_transfer_connections
+
+
+def finalize_import(description=''):
+    """Rebuild derived tables and publish a new dataset version; returns a summary dict"""
+    segment_count = rebuild_trip_segments()
+    connection_count = build_transfer_connections()
+
+    # The version and its change log become visible together
+    with transaction.atomic():
+        version = bump_dataset_version(description)
+        timetable = Timetable.from_database(version=version.id)
+        change_count = record_changes(version, timetable)
+
+    # The bundle is a derived artifact: a read-only static directory must not fail the import
+    try:
+        bundle = write_bundle(timetable)['url']
+    except OSError:
+        bundle = None
+
+    return {
+        'segments': segment_count,
+        'connections': connection_count,
+        'version': version.id,
+        'changes': change_count,
+        'bundle': bundle,
+    }
+
+
+def finalize_import_report(description=''):
+    """finalize_import for the import scripts, printing its summary; returns the summary dict"""
+    print("\n🔗 Rebuilding trip segments and transfer hubs...")
+    summary = finalize_import(description)
+    print(f"   Segments: {summary['segments']}")
+    print(f"   Connections: {summary['connections']}")
+    print(f"   Dataset version: {summary['version']}")
+    print(f"   Changes since previous version: {summary['changes']}")
+    print(f"   Bundle: {summary['bundle'] or 'not written'}")
+    return summary
@@ -0,0 +1,187 @@
+"""
+Request profiling for sampled API requests.
+
+RequestProfilingMiddleware picks REQUEST_PROFILING_SAMPLE_RATE of the
+requests and records the wall time of the phases the views mark with
+``phase()``, their result counts (``record_count()``) and the database
+queries run on the request's connection. The profile is returned in a
+Server-Timing header and logged as one JSON line on the 'api.profiling'
+logger. Unsampled requests only pay for a random number and a context
+variable lookup per phase and query.
+
+Queries are counted by a hook installed on every database connection
+(install_query_hook) that reads the request's profile from a context
+variable, so queries run through sync_to_async by an async view count too.
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('api.profiling')
+
+_profile = contextvars.ContextVar('request_profile', default=None)
+# End marker for timed()
+_DONE = object()
+
+
+def get_sample_rate():
+    """Fraction of requests profiled (settings.REQUEST_PROFILING_SAMPLE_RATE)"""
+    return getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.0)
+
+
+class RequestProfile:
+    """Phase timings (ms, summed per name), counts and query totals of one request"""
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self.queries = 0
+        self.query_ms = 0.0
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds * 1000
+
+    def add_count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_query(self, seconds):
+        self.queries += 1
+        self.query_ms += seconds * 1000
+
+    def server_timing(self, total_ms):
+        """Server-Timing header value"""
+        metrics = [f'{name};dur={ms:.2f}' for name, ms in self.phases.items()]
+        metrics.append(f'db;dur={self.query_ms:.2f};desc="{self.queries} queries"')
+        metrics.append(f'total;dur={total_ms:.2f}')
+        return ', '.join(metrics)
+
+
+def install_query_hook(hook, uid):
+    """
+    Run ``hook`` (an execute wrapper, see connection.execute_wrapper) around
+    every query of every database connection, open or opened later. It is
+    put first so wrappers pushed and popped by callers stay on top of it.
+    """
+    def install(connection, **kwargs):
+        if hook not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, hook)
+
+    connection_created.connect(install, weak=False, dispatch_uid=uid)
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def time_query(execute, sql, params, many, context):
+    """Query hook adding each query to the current request's profile, if it is sampled"""
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(time.perf_counter() - start)
+
+
+@contextmanager
+def phase(name):
+    """Time a block as phase ``name`` of the current request's profile, if it is sampled"""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+
+def timed(name, iterable):
+    """Iterate ``iterable``, timing the production of each item as phase ``name``"""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            item = next(iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+def record_count(name, value):
+    """Add ``value`` to count ``name`` of the current request's profile, if it is sampled"""
+    profile = _profile.get()
+    if profile is not None:
+        profile.add_count(name, value)
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile a sample of requests; works under WSGI and ASGI. Queries made on
+    threads that do not inherit the request's context (parallel batch
+    searches, connection legs) are not counted; streamed responses report
+    what happened before streaming started.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_query_hook(time_query, 'api.profiling')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rate = get_sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.report(request, response, profile, start)
+
+    async def __acall__(self, request):
+        rate = get_sample_rate()
+        if rate <= 0 or random.random() >= rate:
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.report(request, response, profile, start)
+
+    def report(self, request, response, profile, start):
+        """Add the Server-Timing header and log the profile"""
+        total_ms = (time.perf_counter() - start) * 1000
+        response['Server-Timing'] = profile.server_timing(total_ms)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'query': request.META.get('QUERY_STRING', ''),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_queries': profile.queries,
+            'db_ms': round(profile.query_ms, 2),
+            'phases': {name: round(ms, 2) for name, ms in profile.phases.items()},
+            'counts': profile.counts,
+        }))
+        return response
@@ -0,0 +1,49 @@
+"""
+Bounded top-k selection of search results.
+
+Candidates are pushed as they are generated and only the ``limit`` best are
+kept, so the memory and serialization work of a search scale with the number
+of results returned rather than with the number of train pairs examined.
+"""
+import heapq
+
+# Most results a search may return (the 'limit' query parameter is capped here)
+MAX_RESULTS = 20
+
+
+class TopJourneys:
+    """
+    The ``limit`` lowest-scored journeys pushed so far.
+
+    Ties keep the journey pushed first, so the outcome matches a stable sort
+    of every candidate followed by a slice.
+    """
+
+    def __init__(self, limit=MAX_RESULTS):
+        self.limit = limit
+        # (-score, -order, journey): the worst kept journey is on top
+        self._heap = []
+        self._pushed = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def accepts(self, score):
+        """True if a journey scoring ``score`` (or a lower bound of it) could still be kept"""
+        return len(self._heap) < self.limit or score < -self._heap[0][0]
+
+    def push(self, score, journey):
+        """Offer a journey; True if it is kept (for now)"""
+        entry = (-score, -self._pushed, journey)
+        self._pushed += 1
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+        elif score < -self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return False
+        return True
+
+    def results(self):
+        """Kept journeys, best first"""
+        return [journey for _, _, journey in sorted(self._heap, reverse=True)]
@@ -0,0 +1,195 @@
+"""
+RAPTOR (round-based) journey planner over the compiled timetable snapshot.
+
+Trains are grouped into route patterns: trains of the same Route that call at
+exactly the same stations in the same order and never overtake each other.
+Round ``k`` finds the earliest arrival at every station using at most ``k``
+trains, so after ``max_transfers + 1`` rounds the improvements at the target
+form the Pareto set of (arrival time, number of transfers).
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from .csa import INFINITY, get_min_transfer_minutes
+from .timetable import NO_TIME, MINUTES_PER_DAY
+
+DEFAULT_MAX_TRANSFERS = 3
+
+
+class RoutePattern:
+    """Trains sharing one stop pattern, ordered so times never decrease between trips"""
+
+    __slots__ = ('stations', 'trains', 'stops', 'times')
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.trains = []
+        # stops[trip] -> stop indices of that trip, one per position
+        self.stops = []
+        # times[position] -> array of departure minutes, one per trip
+        self.times = [array('l') for _ in stations]
+
+    def accepts(self, times):
+        """True if a trip with these times can be appended without overtaking"""
+        if not self.trains:
+            return True
+        return all(column[-1] <= time for column, time in zip(self.times, times))
+
+    def add(self, train, stops, times):
+        self.trains.append(train)
+        self.stops.append(array('l', stops))
+        for column, time in zip(self.times, times):
+            column.append(time)
+
+
+class Raptor:
+    """Route patterns of a Timetable and the per-station list of patterns serving it"""
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        stop_time = timetable.stop_time
+        stop_station = timetable.stop_station
+
+        trips = {}
+        for train in range(len(timetable.train_ids)):
+            stops = [s for s in timetable.train_stops(train) if stop_time[s] != NO_TIME]
+            if len(stops) < 2:
+                continue
+            # Continuous minutes so a trip running past midnight keeps increasing
+            times = []
+            offset = 0
+            for stop in stops:
+                time = stop_time[stop] + offset
+                if times and time < times[-1]:
+                    offset += MINUTES_PER_DAY
+                    time += MINUTES_PER_DAY
+                times.append(time)
+            key = (timetable.train_route_name[train], tuple(stop_station[s] for s in stops))
+            trips.setdefault(key, []).append((times, train, stops))
+
+        self.patterns = []
+        for (_, stations), pattern_trips in trips.items():
+            pattern_trips.sort()
+            patterns = []
+            for times, train, stops in pattern_trips:
+                pattern = next((p for p in patterns if p.accepts(times)), None)
+                if pattern is None:
+                    pattern = RoutePattern(stations)
+                    patterns.append(pattern)
+                pattern.add(train, stops, times)
+            self.patterns.extend(patterns)
+
+        # station -> [(pattern index, position), ...]
+        self.station_patterns = [[] for _ in timetable.station_ids]
+        for index, pattern in enumerate(self.patterns):
+            for position, station in enumerate(pattern.stations):
+                self.station_patterns[station].append((index, position))
+
+    def earliest_trip(self, pattern, position, ready, allowed_days):
+        """Index of the first trip of a pattern leaving ``position`` at or after ``ready``"""
+        column = pattern.times[position]
+        operating_days = self.timetable.train_operating_days
+        for trip in range(bisect_left(column, ready), len(column)):
+            if allowed_days is None or operating_days[pattern.trains[trip]] in allowed_days:
+                return trip
+        return None
+
+    def pareto(self, origin, target, departure, max_transfers=DEFAULT_MAX_TRANSFERS,
+               min_transfer=None, allowed_days=None):
+        """
+        Pareto-optimal journeys from ``origin`` to ``target`` leaving at or after ``departure``.
+
+        Returns a list of journeys ordered by number of transfers; each journey
+        is a list of legs ``(train, board_stop, alight_stop)`` in stop indices.
+        """
+        if origin == target:
+            return []
+        if min_transfer is None:
+            min_transfer = get_min_transfer_minutes()
+
+        n_stations = len(self.timetable.station_ids)
+        best = [INFINITY] * n_stations
+        best[origin] = departure
+        labels = [INFINITY] * n_stations
+        labels[origin] = departure
+        # round_parents[k][station] -> (pattern, trip, board position, alight position)
+        round_parents = [[None] * n_stations]
+        marked = {origin}
+        journeys = []
+
+        for _ in range(max_transfers + 1):
+            previous_labels = labels
+            labels = list(previous_labels)
+            parents = list(round_parents[-1])
+            round_parents.append(parents)
+
+            # Collect each pattern once, from the earliest marked position
+            queue = {}
+            for station in marked:
+                for index, position in self.station_patterns[station]:
+                    if position < queue.get(index, INFINITY):
+                        queue[index] = position
+            marked = set()
+
+            for index, start in queue.items():
+                pattern = self.patterns[index]
+                trip = None
+                board = None
+                for position in range(start, len(pattern.stations)):
+                    station = pattern.stations[position]
+                    if trip is not None:
+                        time = pattern.times[position][trip]
+                        if time < best[station] and time < best[target]:
+                            labels[station] = best[station] = time
+                            parents[station] = (index, trip, board, position)
+                            marked.add(station)
+
+                    ready = previous_labels[station]
+                    if ready >= INFINITY:
+                        continue
+                    if station != origin:
+                        ready += min_transfer
+                    if trip is None or ready <= pattern.times[position][trip]:
+                        candidate = self.earliest_trip(pattern, position, ready, allowed_days)
+                        if candidate is not None and (trip is None or candidate < trip):
+                            trip = candidate
+                            board = position
+
+            if labels[target] < previous_labels[target]:
+                journeys.append(self._extract(origin, target, round_parents))
+            if not marked:
+                break
+
+        return journeys
+
+    def _extract(self, origin, target, round_parents):
+        """Follow the parent pointers back from the last round to the origin"""
+        legs = []
+        station = target
+        k = len(round_parents) - 1
+        while station != origin and k > 0:
+            index, trip, board, alight = round_parents[k][station]
+            pattern = self.patterns[index]
+            stops = pattern.stops[trip]
+            legs.append((pattern.trains[trip], stops[board], stops[alight]))
+            station = pattern.stations[board]
+            k -= 1
+        legs.reverse()
+        return legs
+
+
+_raptor = None
+_raptor_lock = threading.Lock()
+
+
+def get_raptor(timetable):
+    """Return the Raptor route patterns for a timetable snapshot (the last one built is kept)"""
+    global _raptor
+    raptor = _raptor
+    if raptor is None or raptor.timetable is not timetable:
+        with _raptor_lock:
+            if _raptor is None or _raptor.timetable is not timetable:
+                _raptor = Raptor(timetable)
+            raptor = _raptor
+    return raptor
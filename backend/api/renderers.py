@@ -0,0 +1,29 @@
+"""
+Renderers for content types the DRF defaults don't cover.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON (one record per line).
+
+    Selecting it lets a view negotiate ``Accept: application/x-ndjson`` and
+    stream its records itself; a plain Response (e.g. an error) renders as
+    a single record.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ndjson_line(data)
+
+
+def ndjson_line(record):
+    """One NDJSON line for a record"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
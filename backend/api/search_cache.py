@@ -0,0 +1,64 @@
+"""
+Cache of /api/search/ results in the 'search' cache alias.
+
+Keys are built from the normalized query (station pair, day type, departure
+time rounded down to SEARCH_CACHE_TIME_BUCKET minutes, search mode) and the
+dataset version, so publishing a new import makes every older entry
+unreachable instead of having to delete it.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .dataset import get_dataset_version
+from .metrics import record_cache
+from .timetable import format_minutes, parse_minutes
+
+SEARCH_CACHE_ALIAS = 'search'
+
+
+def get_search_cache():
+    """The cache backing search results (falls back to 'default' if not configured)"""
+    if SEARCH_CACHE_ALIAS in settings.CACHES:
+        return caches[SEARCH_CACHE_ALIAS]
+    return caches['default']
+
+
+def get_time_bucket():
+    """Width (in minutes) of the departure time buckets (settings.SEARCH_CACHE_TIME_BUCKET)"""
+    return max(1, getattr(settings, 'SEARCH_CACHE_TIME_BUCKET', 5))
+
+
+def normalize_departure_time(departure_time_str):
+    """Round an HH:MM string down to its time bucket; None if missing or invalid"""
+    minutes = parse_minutes(departure_time_str)
+    if minutes is None:
+        return None
+    return format_minutes(minutes - minutes % get_time_bucket())
+
+
+def day_type(day_of_week):
+    """Collapse a day of week (0=Sunday ... 5=Friday) to what the search depends on"""
+    try:
+        return 'friday' if int(day_of_week) == 5 else 'weekday'
+    except (TypeError, ValueError):
+        return 'any'
+
+
+def search_cache_key(from_station_id, to_station_id, departure_time, day_of_week, mode=''):
+    """Cache key for one normalized search, tied to the current dataset version"""
+    return 'search:v{}:{}:{}:{}:{}:{}'.format(
+        get_dataset_version(), from_station_id, to_station_id,
+        day_type(day_of_week), departure_time or '-', mode or 'scored',
+    )
+
+
+def get_cached_search(key):
+    """Cached results for a key, or None; counts the hit or miss (traindz_cache_requests_total)"""
+    results = get_search_cache().get(key)
+    record_cache('search', results is not None)
+    return results
+
+
+def set_cached_search(key, results):
+    get_search_cache().set(key, results)
+
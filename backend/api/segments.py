@@ -0,0 +1,167 @@
+"""
+Materialized station-pair trip segments (the TripSegment table).
+
+Each row is one way to ride a single train from one station to a later one,
+already filtered with the same rules as the direct search (first call at each
+station, forward in sequence and time, no shuttle loop in between). A direct
+search is then one range scan of the (origin, destination, departure) index.
+"""
+from django.db import transaction
+
+from .models import Station, Train, Stop, TripSegment, Connection
+from .timetable import time_to_minutes, NO_TIME, StationRef
+
+BATCH_SIZE = 5000
+
+
+def train_segments(stops):
+    """
+    Yield (origin, destination) index pairs for one train.
+
+    ``stops`` is a list of (station_id, minutes) in sequence order.
+    """
+    first_call = {}
+    next_call = [None] * len(stops)
+    last_seen = {}
+    for index, (station_id, _) in enumerate(stops):
+        first_call.setdefault(station_id, index)
+        if station_id in last_seen:
+            next_call[last_seen[station_id]] = index
+        last_seen[station_id] = index
+
+    calls = sorted(first_call.values())
+    for position, origin in enumerate(calls):
+        departure = stops[origin][1]
+        if departure == NO_TIME:
+            continue
+        for destination in calls[position + 1:]:
+            arrival = stops[destination][1]
+            if arrival == NO_TIME or arrival < departure:
+                continue
+            # Origin station called at again before the destination (shuttle loop)
+            if next_call[origin] is not None and next_call[origin] <= destination:
+                continue
+            yield origin, destination
+
+
+@transaction.atomic
+def rebuild_trip_segments():
+    """Recompute the TripSegment table from Train/Stop; returns the number of rows"""
+    TripSegment.objects.all().delete()
+
+    operating_days = dict(Train.objects.values_list('id', 'operating_days'))
+    stops = Stop.objects.order_by('train_id', 'sequence', 'id').values_list(
+        'train_id', 'station_id', 'departure_time', 'sequence'
+    )
+
+    batch = []
+    created = 0
+
+    def flush_train(train_id, train_stops):
+        calls = [(station_id, time_to_minutes(departure_time)) for station_id, departure_time, _ in train_stops]
+        for origin, destination in train_segments(calls):
+            batch.append(TripSegment(
+                train_id=train_id,
+                origin_station_id=calls[origin][0],
+                destination_station_id=calls[destination][0],
+                origin_sequence=train_stops[origin][2],
+                destination_sequence=train_stops[destination][2],
+                departure_minutes=calls[origin][1],
+                arrival_minutes=calls[destination][1],
+                operating_days=operating_days.get(train_id, 'daily'),
+            ))
+
+    current_train = None
+    current_stops = []
+    for train_id, station_id, departure_time, sequence in stops.iterator(chunk_size=BATCH_SIZE):
+        if train_id != current_train:
+            if current_stops:
+                flush_train(current_train, current_stops)
+            current_train = train_id
+            current_stops = []
+        current_stops.append((station_id, departure_time, sequence))
+        if len(batch) >= BATCH_SIZE:
+            TripSegment.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if current_stops:
+        flush_train(current_train, current_stops)
+    TripSegment.objects.bulk_create(batch)
+    created += len(batch)
+
+    return created
+
+
+def find_segments(origin_station_id, destination_station_id, operating_days=None, earliest=None):
+    """
+    Segments riding one train from origin to destination, ordered by departure.
+
+    Optionally limited to trains with one of ``operating_days`` and to
+    departures at or after ``earliest`` (minutes since midnight).
+    """
+    segments = TripSegment.objects.filter(
+        origin_station_id=origin_station_id,
+        destination_station_id=destination_station_id
+    )
+    if operating_days is not None:
+        segments = segments.filter(operating_days__in=operating_days)
+    if earliest is not None:
+        segments = segments.filter(departure_minutes__gte=earliest)
+    return segments.order_by('departure_minutes')
+
+
+def segment_transfer_candidates(from_station, to_station):
+    """
+    Candidate transfer stations from the Connection table (or, until it is
+    built, the TripSegment index), plus a batched loader of each train's stop
+    sequence (station id -> (first, last sequence)).
+    """
+    transfer_stations = [
+        StationRef(*row)
+        for row in Connection.objects.filter(
+            from_station_id=from_station.id, to_station_id=to_station.id
+        ).order_by('transfer_time_minutes').values_list(
+            'transfer_station_id', 'transfer_station__name_fr', 'transfer_station__name_ar'
+        )
+    ]
+    if transfer_stations or Connection.objects.exists():
+        return transfer_stations, positions_loader()
+
+    reachable_station_ids = set(TripSegment.objects.filter(
+        origin_station_id=from_station.id
+    ).values_list('destination_station_id', flat=True).distinct())
+    feeder_station_ids = set(TripSegment.objects.filter(
+        destination_station_id=to_station.id
+    ).values_list('origin_station_id', flat=True).distinct())
+
+    transfer_station_ids = (reachable_station_ids & feeder_station_ids) - {from_station.id, to_station.id}
+    transfer_stations = [
+        StationRef(*row)
+        for row in Station.objects.filter(id__in=transfer_station_ids).values_list('id', 'name_fr', 'name_ar')
+    ]
+    return transfer_stations, positions_loader()
+
+
+def positions_loader():
+    """
+    Batched, cached loader of train stop sequences: station id -> (first, last sequence).
+
+    A loader may be shared by searches running in several threads: trains
+    are only published once their positions are complete.
+    """
+    positions_by_train = {}
+
+    def load_positions(train_ids):
+        missing = set(train_ids) - positions_by_train.keys()
+        if missing:
+            loaded = {train_id: {} for train_id in missing}
+            stops = Stop.objects.filter(train_id__in=missing).order_by('train_id', 'sequence').values_list(
+                'train_id', 'station_id', 'sequence'
+            )
+            for train_id, station_id, sequence in stops:
+                positions = loaded[train_id]
+                positions[station_id] = (positions.get(station_id, (sequence, sequence))[0], sequence)
+            positions_by_train.update(loaded)
+        return positions_by_train
+
+    return load_positions
@@ -0,0 +1,64 @@
+"""
+Station name variants: the aliases the import scripts fold into canonical
+names, and the accent-free form names are matched on (api.suggest).
+"""
+import re
+import unicodedata
+
+# Station name normalization mapping
+STATION_NAME_MAPPING = {
+    # Variations with hyphens
+    'El-Harrach': 'El Harrach',
+    'Oued-Smar': 'Oued Smar',
+    'Bab-Ezzouar': 'Bab Ezzouar',
+    'Dar-El-Beida': 'Dar El Beida',
+    'Dar El-Beida': 'Dar El Beida',
+    'Dar El Beïda': 'Dar El Beida',
+    'Rouiba-Ind': 'Rouiba Ind',
+    'Rouiba-SNVI': 'Rouiba SNVI',
+    'Reghaia-Ind': 'Reghaia Ind',
+    'Gué-de-Constantine': 'Gué de Constantine',
+    'Ain-Naadja': 'Ain Naadja',
+    'Baba-Ali': 'Baba Ali',
+    'Beni-Mered': 'Beni Mered',
+    'Tessala-El-Merdja': 'Tessala El Merdja',
+    'Sidi-Abdelah': 'Sidi Abdelah',
+    'Aeroport-Houari-Boumediene': 'Aeroport Houari Boumediene',
+    # Special characters (accents)
+    'Thénia': 'Thenia',
+    'Boumerdès': 'Boumerdes',
+    'Réghaïa': 'Reghaia',
+    # Abbreviations (these now exist as separate stations)
+    # 'B.Mered' is kept separate
+    # 'Gué de Cne' is kept separate
+    'H.Dey': 'Hussein Dey',
+    'Sidi Abde allah': 'Sidi Abdelah',
+    'Sidi Abde allah-U': 'Sidi Abdelah-U',
+}
+
+
+def normalize_station_name(name):
+    """Normalize station name to canonical form"""
+    if not name:
+        return None
+    name = ' '.join(name.split())
+    return STATION_NAME_MAPPING.get(name, name)
+
+
+# Arabic letter variants written interchangeably in station names
+ARABIC_FOLDING = str.maketrans({
+    '\u0649': '\u064a',  # alef maksura -> yeh
+    '\u0629': '\u0647',  # teh marbuta -> heh
+    '\u0640': None,       # tatweel
+})
+
+
+def fold_name(name):
+    """
+    Lowercase, accent-free form of a French or Arabic station name, with
+    punctuation turned into single spaces ('Thénia' -> 'thenia',
+    'H.Dey' -> 'h dey'). Arabic hamza and short vowel marks are dropped too.
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[\W_]+', ' ', stripped.translate(ARABIC_FOLDING).lower()).split())
@@ -0,0 +1,111 @@
+"""
+Station autocomplete index (/api/stations/suggest/).
+
+Built once per dataset version from the French and Arabic station names and
+the import aliases (STATION_NAME_MAPPING), all accent-folded (fold_name).
+A query is answered from a sorted list of name and word prefixes first and,
+when those run short, by trigram similarity to catch misspellings.
+"""
+from bisect import bisect_left
+from collections import Counter
+
+from .dataset import per_dataset_version
+from .models import Station
+from .station_names import STATION_NAME_MAPPING, fold_name
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+# Least trigram similarity (shared / all distinct trigrams) of a fuzzy match
+MIN_SIMILARITY = 0.3
+
+# Match kinds, best first
+EXACT, NAME_PREFIX, WORD_PREFIX, FUZZY = range(4)
+
+
+def trigrams(folded):
+    """Trigrams of a folded name, each word padded like pg_trgm ('  word ')"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class StationIndex:
+    """
+    Prefix and trigram index over station names.
+
+    ``stations`` are (id, name_fr, name_ar) tuples; each one is findable by
+    both names and by every alias mapped to its French name.
+    """
+
+    def __init__(self, stations, version=0):
+        self.version = version
+        self.stations = list(stations)
+
+        aliases = {}
+        for alias, canonical in STATION_NAME_MAPPING.items():
+            aliases.setdefault(canonical, []).append(alias)
+
+        # Every folded name: (folded, station position)
+        self.names = []
+        for position, (_, name_fr, name_ar) in enumerate(self.stations):
+            for name in [name_fr, name_ar] + aliases.get(name_fr, []):
+                folded = fold_name(name)
+                if folded:
+                    self.names.append((folded, position))
+
+        # Sorted prefix keys: whole names, then each later word onwards
+        entries = []
+        for folded, position in self.names:
+            words = folded.split(' ')
+            entries.append((folded, NAME_PREFIX, position))
+            entries.extend((' '.join(words[i:]), WORD_PREFIX, position) for i in range(1, len(words)))
+        entries.sort()
+        self.prefix_keys = [key for key, _, _ in entries]
+        self.prefix_entries = entries
+
+        # Trigram -> names containing it
+        self.name_trigrams = [trigrams(folded) for folded, _ in self.names]
+        self.trigram_names = {}
+        for name, grams in enumerate(self.name_trigrams):
+            for gram in grams:
+                self.trigram_names.setdefault(gram, []).append(name)
+
+    def suggest(self, query, limit=DEFAULT_SUGGESTIONS):
+        """Stations matching ``query`` as (id, name_fr, name_ar), best first"""
+        folded = fold_name(query)
+        if not folded:
+            return []
+
+        # (kind, -similarity) of the best match of each station
+        best = {}
+
+        def offer(position, rank):
+            if position not in best or rank < best[position]:
+                best[position] = rank
+
+        start = bisect_left(self.prefix_keys, folded)
+        for key, kind, position in self.prefix_entries[start:]:
+            if not key.startswith(folded):
+                break
+            offer(position, (EXACT if key == folded and kind == NAME_PREFIX else kind, 0.0))
+
+        if len(best) < limit:
+            query_grams = trigrams(folded)
+            shared = Counter(
+                name for gram in query_grams for name in self.trigram_names.get(gram, ())
+            )
+            for name, count in shared.items():
+                similarity = count / (len(query_grams) + len(self.name_trigrams[name]) - count)
+                if similarity >= MIN_SIMILARITY:
+                    offer(self.names[name][1], (FUZZY, -similarity))
+
+        ranked = sorted(best, key=lambda position: (best[position], self.stations[position][1]))
+        return [self.stations[position] for position in ranked[:limit]]
+
+
+# Process-wide station index, rebuilt whenever a newer dataset version is published
+get_station_index = per_dataset_version(
+    lambda version: StationIndex(Station.objects.values_list('id', 'name_fr', 'name_ar'), version=version)
+)
@@ -1,3 +1,526 @@
-from django.test import TestCase
+"""
+Query budgets of the API endpoints.
 
-# Create your tests here.
+Each endpoint must run a fixed number of SQL queries however large the
+network is: the same budgets are checked on a small and a larger fixture
+network, so a change that brings back per-row (N+1) queries fails here.
+Timing ceilings are coarse and only catch gross regressions. The routing
+algorithms (api.csa, api.raptor) are checked on a hand-built timetable.
+"""
+import gzip
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, time as dtime
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .bundle import write_bundle
+from .changes import record_changes
+from .csa import ConnectionScan
+from .dataset import bump_dataset_version, get_dataset_version, reset_dataset_version
+from .metrics import CACHE_REQUESTS
+from .models import Line, Station, Route, Train, Stop, TimetableChange
+from .pipeline import finalize_import
+from .raptor import Raptor
+from .timetable import OPERATING_DAY_CODES, Timetable, clear_timetable, day_number, get_timetable
+from .views import decode_journey_id, encode_journey_id
+
+# Most SQL queries allowed per request, each counting one for a dataset version refresh
+BUDGETS = {
+    'stations': 2,
+    'lines': 2,
+    'search_direct': 1,  # Served from the timetable snapshot
+    'search_connection': 1,
+    'search_direct_segments': 9,  # TIMETABLE_SNAPSHOT = False: TripSegment index and Connection table
+    'search_connection_segments': 9,
+    'search_empty_segments': 9,  # No Connection Scan fallback, hence no snapshot
+}
+# Alger - El Harrach, the trunk shared by the suburban lines
+TRUNK = ['Alger', 'Agha', 'Ateliers', 'Hussein Dey', 'Caroubier', 'El Harrach']
+# Slowest allowed request (seconds); generous, for slow CI machines
+TIME_CEILING = 2.0
+
+
+def build_network(trunk, lines, stations_per_line, trains_per_direction):
+    """
+    SNTF-like fixture: every line runs along the ``trunk`` stations, from
+    Alger to El Harrach, then along its own branch. Trains leave each end
+    hourly from 05:00; every fifth one does not run on Fridays. Every stop
+    has a departure time, as in the importers (the terminus departs on
+    arrival). Returns the station names in the order created.
+    """
+    names = trunk + [f"L{line} Station {i}" for line in range(1, lines + 1) for i in range(1, stations_per_line + 1)]
+    stations = {station.name_fr: station for station in Station.objects.bulk_create(
+        Station(name_fr=name, name_ar=name) for name in names
+    )}
+
+    trains = []
+    for line in range(1, lines + 1):
+        line_row = Line.objects.create(name=f"Line {line}", code=f"L{line}")
+        route_stations = [stations[name] for name in trunk]
+        route_stations += [stations[f"L{line} Station {i}"] for i in range(1, stations_per_line + 1)]
+        Station.objects.filter(id__in=[station.id for station in route_stations[len(trunk):]]).update(line=line_row)
+        for direction, order in ((1, route_stations), (-1, route_stations[::-1])):
+            route = Route.objects.create(line=line_row, origin=order[0], destination=order[-1],
+                                         name=f"{order[0].name_fr} - {order[-1].name_fr}")
+            for number in range(trains_per_direction):
+                operating_days = 'no_friday' if number % 5 == 4 else 'daily'
+                trains.append((Train(number=f"{line}{direction % 3}{number:02d}", route=route,
+                                     operating_days=operating_days), order, 5 * 60 + number * 60))
+    Train.objects.bulk_create(train for train, _, _ in trains)
+
+    stops = []
+    for train, order, departure in trains:
+        for sequence, station in enumerate(order, start=1):
+            minutes = departure + (sequence - 1) * 4
+            stops.append(Stop(
+                train=train, station=station, sequence=sequence,
+                arrival_time=dtime(minutes // 60, minutes % 60) if sequence > 1 else None,
+                departure_time=dtime(minutes // 60, minutes % 60),
+            ))
+    Stop.objects.bulk_create(stops, batch_size=1000)
+    return names
+
+
+class QueryBudgetMixin:
+    """Budget checks, run by subclasses against networks of different sizes"""
+    TRUNK = [TRUNK[0], TRUNK[1], TRUNK[-1]]
+    LINES = 2
+    STATIONS_PER_LINE = 3
+    TRAINS_PER_DIRECTION = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bundle_root = tempfile.mkdtemp()
+        with override_settings(TIMETABLE_BUNDLE_ROOT=cls.bundle_root):
+            build_network(cls.TRUNK, cls.LINES, cls.STATIONS_PER_LINE, cls.TRAINS_PER_DIRECTION)
+            finalize_import('tests')
+        cls.station_ids = dict(Station.objects.values_list('name_fr', 'id'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.bundle_root, ignore_errors=True)
+
+    def setUp(self):
+        # Dataset versions restart with every test class: drop what earlier classes built
+        reset_dataset_version()
+        clear_timetable()
+        caches['search'].clear()
+
+    def assertWithinBudget(self, budget, path, params=None):
+        """GET ``path`` twice (the first one warms the process-wide state); check the second"""
+        self.client.get(path, {**(params or {}), 'warmup': 1})
+        caches['search'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.get(path, params or {})
+            elapsed = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), BUDGETS[budget],
+            f"{budget}: {len(queries)} queries\n" + '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        self.assertLess(elapsed, TIME_CEILING, f"{budget}: {elapsed:.2f}s")
+        return response
+
+    def search(self, origin, destination):
+        return {'from': self.station_ids[origin], 'to': self.station_ids[destination], 'time': '06:00', 'day': 1}
+
+    def test_stations_list(self):
+        response = self.assertWithinBudget('stations', '/api/stations/')
+        self.assertEqual(len(response.json()), len(self.station_ids))
+        self.assertIn('line_name', response.json()[-1])
+
+    def test_lines_list(self):
+        self.assertWithinBudget('lines', '/api/lines/')
+
+    def test_search_direct(self):
+        response = self.assertWithinBudget('search_direct', '/api/search/', self.search('Alger', 'L1 Station 2'))
+        self.assertEqual(response.json()[0]['type'], 'direct')
+
+    def test_search_connection(self):
+        response = self.assertWithinBudget('search_connection', '/api/search/', self.search('L1 Station 1', 'L2 Station 2'))
+        self.assertEqual(response.json()[0]['type'], 'connection')
+        # Change where the lines part, not further down the trunk and back
+        self.assertEqual({result['transfer']['station'] for result in response.json()}, {'El Harrach'})
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0)
+    def test_search_is_measured(self):
+        get_timetable()
+        counts = dict(CACHE_REQUESTS.values)
+        with self.assertLogs('api.profiling', 'INFO'):
+            response = self.client.get('/api/search/', self.search('L1 Station 1', 'L2 Station 2'))
+            metrics = self.client.get('/metrics').content.decode()
+        # One snapshot lookup per request, however many steps the search takes
+        self.assertEqual(CACHE_REQUESTS.values.get(('timetable', 'hit'), 0), counts.get(('timetable', 'hit'), 0) + 1)
+        self.assertEqual(CACHE_REQUESTS.values.get(('timetable', 'miss')), counts.get(('timetable', 'miss')))
+        self.assertIn('traindz_cache_requests_total{cache="timetable",result="hit"}', metrics)
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_search_to_terminus(self):
+        terminus = f"L1 Station {self.STATIONS_PER_LINE}"
+        response = self.assertWithinBudget('search_direct', '/api/search/', self.search('Alger', terminus))
+        self.assertEqual(response.json()[0]['type'], 'direct')
+        self.assertEqual(response.json()[0]['stops'][-1]['station'], terminus)
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_search_direct_segments(self):
+        response = self.assertWithinBudget('search_direct_segments', '/api/search/', self.search('Alger', 'L1 Station 2'))
+        self.assertEqual(response.json()[0]['type'], 'direct')
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_search_connection_segments(self):
+        response = self.assertWithinBudget(
+            'search_connection_segments', '/api/search/', self.search('L1 Station 1', 'L2 Station 2')
+        )
+        self.assertEqual(response.json()[0]['type'], 'connection')
+        # Change where the lines part, not further down the trunk and back
+        self.assertEqual({result['transfer']['station'] for result in response.json()}, {'El Harrach'})
+
+    def assertDeparturesWrap(self):
+        path = f"/api/stations/{self.station_ids['Alger']}/departures/"
+        response = self.client.get(path, {'time': '23:00', 'day': 1, 'limit': 2})
+        self.assertEqual([departure['departure_time'] for departure in response.json()], ['05:00', '05:00'])
+        # The last train of each line, then the first ones of the next morning
+        last = f"{4 + self.TRAINS_PER_DIRECTION:02d}:00"
+        response = self.client.get(path, {'time': last, 'day': 1, 'limit': self.LINES + 1})
+        self.assertEqual([departure['departure_time'] for departure in response.json()], [last] * self.LINES + ['05:00'])
+
+    def test_departures_wrap_past_midnight(self):
+        self.assertDeparturesWrap()
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_departures_wrap_past_midnight_from_database(self):
+        self.assertDeparturesWrap()
+
+    def test_matching_etag_is_not_modified(self):
+        path = f"/api/stations/{self.station_ids['Alger']}/departures/"
+        params = {'time': '08:55', 'day': 1}
+        etag = self.client.get(path, params)['ETag']
+        response = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # A new dataset version changes the ETag: the full response comes back
+        bump_dataset_version('tests')
+        response = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def assertBatchInOrder(self, parallel):
+        queries = [
+            self.search('L1 Station 1', 'L2 Station 2'),
+            {**self.search('Alger', 'L1 Station 2'), 'to': 999999},
+            self.search('Alger', 'L1 Station 2'),
+            'L1 Station 1',
+            {**self.search('L2 Station 1', 'Alger'), 'limit': 'all'},
+            self.search('L2 Station 1', 'Alger'),
+        ]
+        response = self.client.post('/api/search/batch/', {'queries': queries, 'parallel': parallel},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        # Each answer sits at its query's index; a failed query only fails its own entry
+        self.assertEqual([error['index'] for error in body['errors']], [1, 3, 4])
+        self.assertEqual([error['status'] for error in body['errors']], [404, 400, 400])
+        for index, params in enumerate(queries):
+            if index in (1, 3, 4):
+                self.assertIsNone(body['results'][index], index)
+            else:
+                self.assertEqual(body['results'][index], self.client.get('/api/search/', params).json(), index)
+
+    def test_batch_keeps_request_order(self):
+        self.assertBatchInOrder(parallel=False)
+
+    def test_parallel_batch_keeps_request_order(self):
+        self.assertBatchInOrder(parallel=True)
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_batch_keeps_request_order_from_database(self):
+        self.assertBatchInOrder(parallel=False)
+
+    def assertJourneyDetail(self):
+        params = self.search('L1 Station 1', 'L2 Station 2')
+        full = self.client.get('/api/search/', params).json()[0]
+        journey_id = self.client.get('/api/search/', {**params, 'compact': 1}).json()[0]['journey_id']
+        response = self.client.get(f"/api/search/journey/{journey_id}/")
+        self.assertEqual(response.status_code, 200)
+        detail = response.json()
+        for key in ('departure_time', 'arrival_time', 'train_number', 'transfer', 'legs'):
+            self.assertEqual(detail[key], full[key], key)
+        self.assertEqual(detail['transfers_count'], 1)
+
+        # Malformed ids
+        for bad in ('v1', '1.2-3-4', f"v{get_dataset_version()}.1-2", 'vx.1-2-3', 'v1.a-b-c'):
+            self.assertEqual(self.client.get(f"/api/search/journey/{bad}/").status_code, 400, bad)
+        # After an import the trains are renumbered: the id is stale
+        bump_dataset_version('tests')
+        self.assertEqual(self.client.get(f"/api/search/journey/{journey_id}/").status_code, 410)
+
+    def test_journey_detail(self):
+        self.assertJourneyDetail()
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_journey_detail_from_database(self):
+        self.assertJourneyDetail()
+
+    def test_departures_default_to_today(self):
+        # The API counts days from Sunday (0); Friday is 5, Thursday 4
+        path = f"/api/stations/{self.station_ids['Alger']}/departures/"
+        params = {'time': '08:55', 'limit': 2 * self.LINES}
+        for today, day in ((datetime(2026, 10, 16, 8, 0), 5), (datetime(2026, 10, 15, 8, 0), 4)):
+            with mock.patch('api.views.datetime', wraps=datetime) as clock:
+                clock.now.return_value = today
+                response = self.client.get(path, params)
+            self.assertEqual(response.json(), self.client.get(path, {**params, 'day': day}).json(), day)
+
+    @override_settings(TIMETABLE_SNAPSHOT=False)
+    def test_segments_never_build_the_snapshot(self):
+        with mock.patch.object(Timetable, 'from_database', side_effect=AssertionError('snapshot built')):
+            # Nothing leaves this late: the search ends without the Connection Scan fallback
+            params = {**self.search('L1 Station 1', 'L2 Station 2'), 'time': '23:50'}
+            response = self.assertWithinBudget('search_empty_segments', '/api/search/', params)
+            self.assertEqual(response.json(), [])
+            # Snapshot algorithms are not available
+            response = self.client.get('/api/search/', {**params, 'mode': 'pareto'})
+            self.assertEqual(response.status_code, 501)
+            response = self.client.get('/api/reachability/', {'from': self.station_ids['Alger'], 'time': '06:00'})
+            self.assertEqual(response.status_code, 501)
+
+    def test_reachability_defaults_to_today(self):
+        params = {'from': self.station_ids['Alger'], 'time': '08:55'}
+        with mock.patch('api.views.datetime', wraps=datetime) as clock:
+            clock.now.return_value = datetime(2026, 10, 16, 8, 0)  # A Friday, day 5
+            response = self.client.get('/api/reachability/', params)
+        self.assertEqual(response.json(), self.client.get('/api/reachability/', {**params, 'day': 5}).json())
+
+    def test_reachability_from_unpublished_station(self):
+        # Added without finalize_import: known to the database, not to the timetable snapshot
+        get_timetable()
+        station = Station.objects.create(name_fr='Nouvelle', name_ar='Nouvelle')
+        response = self.client.get('/api/reachability/', {'from': station.id, 'time': '06:00', 'day': 1})
+        self.assertEqual(response.status_code, 404)
+
+
+class SmallNetworkQueryBudgetTests(QueryBudgetMixin, TestCase):
+    pass
+
+
+class LargeNetworkQueryBudgetTests(QueryBudgetMixin, TestCase):
+    TRUNK = TRUNK
+    LINES = 6
+    STATIONS_PER_LINE = 12
+    TRAINS_PER_DIRECTION = 16
+
+
+class JourneyIdTests(SimpleTestCase):
+    def test_round_trip(self):
+        path = [(105, 1, 7), (212, 7, 9)]
+        with mock.patch('api.views.get_dataset_version', return_value=3):
+            journey_id = encode_journey_id(path)
+        self.assertEqual(journey_id, 'v3.105-1-7.212-7-9')
+        self.assertEqual(decode_journey_id(journey_id), (3, path))
+
+    def test_malformed(self):
+        for journey_id in ('', 'v3', '3.105-1-7', 'v3.105-1', 'v3.105-1-7-9', 'v3.a-1-7', 'vx.105-1-7'):
+            self.assertIsNone(decode_journey_id(journey_id), journey_id)
+
+
+class DayNumberTests(SimpleTestCase):
+    def test_days_count_from_sunday(self):
+        # 2026-10-18 is a Sunday
+        days = [day_number(datetime(2026, 10, 18 + offset)) for offset in range(7)]
+        self.assertEqual(days, ['0', '1', '2', '3', '4', '5', '6'])
+
+
+class NearbyValidationTests(TestCase):
+    def test_non_finite_parameters_are_rejected(self):
+        for params in ({'radius': 'nan'}, {'radius': 'inf'}, {'lat': 'nan'}, {'lon': '-inf'}):
+            query = {'lat': '36.7', 'lon': '3.0', **params}
+            self.assertEqual(self.client.get('/api/stations/nearby/', query).status_code, 400, params)
+
+
+class BundleFileTests(TestCase):
+    def setUp(self):
+        self.bundle_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bundle_root, ignore_errors=True)
+        bundle_settings = override_settings(TIMETABLE_BUNDLE_ROOT=self.bundle_root)
+        bundle_settings.enable()
+        self.addCleanup(bundle_settings.disable)
+
+    def test_bundle_written_at_runtime_is_served(self):
+        build_network(TRUNK[:3], 1, 2, 2)
+        manifest = write_bundle()
+        self.assertEqual(self.client.get('/api/timetable/bundle/').json()['url'], manifest['url'])
+
+        response = self.client.get(manifest['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['stations']), 5)
+
+        response = self.client.get(manifest['url'], HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content))), manifest['size'])
+
+    def test_unknown_bundle(self):
+        for name in ('timetable.000000000000.json', 'manifest.json'):
+            self.assertEqual(self.client.get(f'/api/timetable/bundles/{name}').status_code, 404, name)
+
+
+@override_settings(TIMETABLE_CHANGE_RETENTION=2)
+class TimetableChangesTests(TestCase):
+    def setUp(self):
+        reset_dataset_version()
+
+    def publish(self, extra=False, arrival=dtime(10, 0)):
+        """Publish a version with the DIRECT train arriving at ``arrival``, and an EXTRA train if asked"""
+        stations = [(station_id, name, name, None, None) for station_id, name in enumerate('ABCD', start=1)]
+        trains = [(1, 'DIRECT', 'A - D', 'Daily', 'daily')]
+        stops = [(1, 1, dtime(8, 0), 1), (1, 4, arrival, 2)]
+        if extra:
+            trains.append((2, 'EXTRA', 'A - B', 'Daily', 'daily'))
+            stops += [(2, 1, dtime(9, 0), 1), (2, 2, dtime(9, 20), 2)]
+        version = bump_dataset_version('tests')
+        record_changes(version, Timetable(stations, trains, stops, version=version.id))
+        return version.id
+
+    def changes(self, since):
+        response = self.client.get('/api/timetable/changes/', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_are_folded(self):
+        base = self.publish()
+        self.publish(extra=True, arrival=dtime(10, 5))
+        current = self.publish(arrival=dtime(10, 10))
+        changes = self.changes(base)
+        self.assertEqual((changes['version'], changes['full_resync']), (current, False))
+        # EXTRA came and went; DIRECT changed twice and only its last record is sent
+        self.assertEqual(changes['trains']['added'], [])
+        self.assertEqual(changes['trains']['removed'], [])
+        self.assertEqual([train['stops'][-1] for train in changes['trains']['modified']], [[4, 10 * 60 + 10]])
+        self.assertEqual(changes['stations'], {'added': [], 'modified': [], 'removed': []})
+        # Up to date: nothing to send
+        self.assertEqual(self.changes(current)['trains'], {'added': [], 'modified': [], 'removed': []})
+
+    def test_removed_train(self):
+        self.publish()
+        since = self.publish(extra=True)
+        self.publish()
+        self.assertEqual(self.changes(since)['trains'], {'added': [], 'modified': [], 'removed': ['EXTRA']})
+
+    def test_log_older_than_retention_is_compacted(self):
+        first = self.publish()
+        second = self.publish(extra=True)
+        for minute in range(5, 15, 5):
+            current = self.publish(arrival=dtime(10, minute))
+        # Only the last two versions keep their log: it reaches back to the second one
+        self.assertEqual(sorted(set(TimetableChange.objects.values_list('version_id', flat=True))),
+                         [current - 1, current])
+        self.assertEqual(self.changes(second)['trains']['removed'], ['EXTRA'])
+        changes = self.changes(first)
+        self.assertEqual((changes['version'], changes['full_resync']), (current, True))
+        self.assertNotIn('trains', changes)
+        self.assertIn('bundle', changes)  # Where to download the full timetable again
+        # A version the server never published
+        self.assertTrue(self.changes(current + 1)['full_resync'])
+
+
+def build_timetable():
+    """
+    In-memory timetable, A to D: a slow direct train, or a faster change at
+    B onto a train that waits 15 minutes (not on Fridays) or one that waits
+    25 minutes.
+    """
+    stations = [(station_id, name, name, None, None) for station_id, name in enumerate('ABCD', start=1)]
+    trains = [
+        (1, 'DIRECT', 'A - D', 'Daily', 'daily'),
+        (2, 'FEEDER', 'A - C', 'Daily', 'daily'),
+        (3, 'QUICK', 'B - D', 'No Friday', 'no_friday'),
+        (4, 'LATER', 'B - D', 'Daily', 'daily'),
+    ]
+    stops = [
+        (1, 1, dtime(8, 0), 1), (1, 4, dtime(10, 0), 2),
+        (2, 1, dtime(8, 5), 1), (2, 2, dtime(8, 30), 2), (2, 3, dtime(8, 50), 3),
+        (3, 2, dtime(8, 45), 1), (3, 4, dtime(9, 15), 2),
+        (4, 2, dtime(8, 55), 1), (4, 4, dtime(9, 30), 2),
+    ]
+    return Timetable(stations, trains, stops)
+
+
+FRIDAY = {OPERATING_DAY_CODES['daily'], OPERATING_DAY_CODES['friday_only']}
+
+
+class ConnectionScanTests(SimpleTestCase):
+    def setUp(self):
+        self.timetable = build_timetable()
+        self.scan = ConnectionScan(self.timetable)
+        self.a, self.b, self.d = (self.timetable.station_index[station_id] for station_id in (1, 2, 4))
+
+    def journey(self, **options):
+        """(train numbers, arrival minute) of the earliest journey from A to D at 08:00"""
+        legs = self.scan.earliest_arrival(self.a, self.d, 8 * 60, **options)
+        trains = [self.timetable.train_number[self.scan.train[board]] for board, _ in legs]
+        return trains, self.scan.arr_time[legs[-1][1]]
+
+    def test_earliest_arrival_changes_trains(self):
+        self.assertEqual(self.journey(min_transfer=10), (['FEEDER', 'QUICK'], 9 * 60 + 15))
+
+    def test_minimum_transfer_time(self):
+        self.assertEqual(self.journey(min_transfer=20), (['FEEDER', 'LATER'], 9 * 60 + 30))
+        self.assertEqual(self.journey(min_transfer=30), (['DIRECT'], 10 * 60))
+
+    def test_operating_days(self):
+        self.assertEqual(self.journey(min_transfer=10, allowed_days=FRIDAY), (['FEEDER', 'LATER'], 9 * 60 + 30))
+
+    def test_no_journey_after_the_last_train(self):
+        self.assertEqual(self.scan.earliest_arrival(self.a, self.d, 8 * 60 + 6, min_transfer=10), [])
+        self.assertEqual(self.scan.earliest_arrival(self.b, self.a, 8 * 60, min_transfer=10), [])
+
+    def test_successive_journeys(self):
+        # The direct train arrives later than the change leaving after it: only the change is listed
+        journeys = self.scan.journeys(self.a, self.d, 8 * 60, 5, min_transfer=10)
+        self.assertEqual([self.scan.dep_time[legs[0][0]] for legs in journeys], [8 * 60 + 5])
+        journeys = self.scan.journeys(self.a, self.d, 8 * 60, 5, min_transfer=30)
+        self.assertEqual([self.scan.dep_time[legs[0][0]] for legs in journeys], [8 * 60])
+
+
+class RaptorTests(SimpleTestCase):
+    def setUp(self):
+        self.timetable = build_timetable()
+        self.raptor = Raptor(self.timetable)
+        self.a, self.d = self.timetable.station_index[1], self.timetable.station_index[4]
+
+    def pareto(self, departure=8 * 60, **options):
+        """(train numbers, arrival minute) of each Pareto-optimal journey from A to D (at 08:00)"""
+        journeys = self.raptor.pareto(self.a, self.d, departure, **options)
+        return [
+            ([self.timetable.train_number[train] for train, _, _ in legs], self.timetable.stop_time[legs[-1][2]])
+            for legs in journeys
+        ]
+
+    def test_pareto_set(self):
+        # Fewer transfers or an earlier arrival: both are kept, fewest transfers first
+        self.assertEqual(self.pareto(min_transfer=10), [
+            (['DIRECT'], 10 * 60),
+            (['FEEDER', 'QUICK'], 9 * 60 + 15),
+        ])
+
+    def test_max_transfers(self):
+        self.assertEqual(self.pareto(min_transfer=10, max_transfers=0), [(['DIRECT'], 10 * 60)])
+
+    def test_minimum_transfer_time(self):
+        self.assertEqual(self.pareto(min_transfer=20)[-1], (['FEEDER', 'LATER'], 9 * 60 + 30))
+        self.assertEqual(self.pareto(min_transfer=30), [(['DIRECT'], 10 * 60)])
+
+    def test_operating_days(self):
+        self.assertEqual(self.pareto(min_transfer=10, allowed_days=FRIDAY)[-1], (['FEEDER', 'LATER'], 9 * 60 + 30))
+
+    def test_dominated_journeys_are_dropped(self):
+        # Leaving after the direct train, only the change remains
+        self.assertEqual(self.pareto(departure=8 * 60 + 1, min_transfer=10), [(['FEEDER', 'QUICK'], 9 * 60 + 15)])
@@ -0,0 +1,246 @@
+"""
+Compiled, read-only timetable snapshot used by the search views.
+
+Stations, trains and stops are loaded once per worker process and laid out
+as compact integer arrays (times in minutes since midnight, stops stored
+contiguously per train) so that a search never has to go back to the ORM.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from .dataset import get_dataset_version
+from .models import Station, Train, Stop, Connection
+
+NO_TIME = -1
+MINUTES_PER_DAY = 24 * 60
+
+# Compact codes for Train.operating_days
+OPERATING_DAY_CODES = {
+    'daily': 0,
+    'no_friday': 1,
+    'friday_only': 2,
+}
+
+StationRef = namedtuple('StationRef', ['id', 'name_fr', 'name_ar'])
+
+
+def time_to_minutes(value):
+    """Convert a datetime.time to minutes since midnight (NO_TIME if missing)"""
+    if value is None:
+        return NO_TIME
+    return value.hour * 60 + value.minute
+
+
+def format_minutes(minutes):
+    """Format minutes since midnight as HH:MM ('-' if missing)"""
+    if minutes == NO_TIME:
+        return '-'
+    minutes %= MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_minutes(value):
+    """Minutes since midnight for an HH:MM string (None if missing or invalid)"""
+    if not value:
+        return None
+    try:
+        hours, minutes = (int(part) for part in value.split(':'))
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def day_number(moment):
+    """Day of week of a datetime as the API counts days (0=Sunday ... 5=Friday, 6=Saturday)"""
+    return str((moment.weekday() + 1) % 7)
+
+
+def format_duration(minutes):
+    """Format a duration in minutes as '2h05' or '45min' ('N/A' if missing)"""
+    if minutes is None or minutes < 0:
+        return 'N/A'
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}" if hours > 0 else f"{minutes}min"
+
+
+class Timetable:
+    """
+    Immutable in-memory copy of the Station/Train/Stop tables.
+
+    Stations and trains are addressed by their position in the snapshot
+    (not their primary key). The stops of train ``t`` are the slice
+    ``train_first_stop[t]:train_first_stop[t + 1]`` of the ``stop_*`` arrays,
+    ordered by sequence. ``station_departures[s]`` lists the stop indices
+    serving station ``s``, sorted by departure time. ``transfers`` maps an
+    (origin, destination) station pair to its precomputed transfer stations
+    from the Connection table, shortest wait first.
+    """
+
+    def __init__(self, stations, trains, stops, connections=(), version=0):
+        # Dataset version the snapshot was built from (api.dataset)
+        self.version = version
+
+        # Stations (coordinates may be None)
+        self.station_ids = []
+        self.station_name_fr = []
+        self.station_name_ar = []
+        self.station_latitude = []
+        self.station_longitude = []
+        self.station_index = {}
+        for station_id, name_fr, name_ar, latitude, longitude in stations:
+            self.station_index[station_id] = len(self.station_ids)
+            self.station_ids.append(station_id)
+            self.station_name_fr.append(name_fr)
+            self.station_name_ar.append(name_ar)
+            self.station_latitude.append(latitude)
+            self.station_longitude.append(longitude)
+
+        # Trains
+        self.train_ids = []
+        self.train_number = []
+        self.train_route_name = []
+        self.train_days_operational = []
+        self.train_operating_days = array('b')
+        self.train_index = {}
+        for train_id, number, route_name, days_operational, operating_days in trains:
+            self.train_index[train_id] = len(self.train_ids)
+            self.train_ids.append(train_id)
+            self.train_number.append(number)
+            self.train_route_name.append(route_name)
+            self.train_days_operational.append(days_operational)
+            self.train_operating_days.append(OPERATING_DAY_CODES.get(operating_days, 0))
+
+        # Stops, grouped per train (stops must arrive ordered by train, sequence)
+        self.stop_train = array('l')
+        self.stop_station = array('l')
+        self.stop_time = array('l')
+        self.stop_sequence = array('l')
+        counts = [0] * len(self.train_ids)
+        for train_id, station_id, departure_time, sequence in stops:
+            train = self.train_index.get(train_id)
+            station = self.station_index.get(station_id)
+            if train is None or station is None:
+                continue
+            counts[train] += 1
+            self.stop_train.append(train)
+            self.stop_station.append(station)
+            self.stop_time.append(time_to_minutes(departure_time))
+            self.stop_sequence.append(sequence)
+
+        self.train_first_stop = array('l', [0])
+        for count in counts:
+            self.train_first_stop.append(self.train_first_stop[-1] + count)
+
+        # Per-station departures, sorted by time
+        departures = [[] for _ in self.station_ids]
+        for stop, station in enumerate(self.stop_station):
+            departures[station].append(stop)
+        stop_time = self.stop_time
+        self.station_departures = [
+            array('l', sorted(stop_list, key=lambda s: (stop_time[s], s)))
+            for stop_list in departures
+        ]
+
+        # Precomputed transfer stations (api.transfers.build_transfer_connections)
+        self.transfers = {}
+        for from_station_id, to_station_id, transfer_station_id, minutes in sorted(connections, key=lambda c: c[3]):
+            key = (self.station_index.get(from_station_id), self.station_index.get(to_station_id))
+            transfer = self.station_index.get(transfer_station_id)
+            if None in key or transfer is None:
+                continue
+            self.transfers.setdefault(key, []).append((transfer, minutes))
+
+    @classmethod
+    def from_database(cls, version=0, train_ids=None):
+        """
+        Build a snapshot from the current database contents (4 queries), or
+        of only the trains in ``train_ids``, without transfers (3 queries)
+        """
+        stations = Station.objects.order_by('id').values_list('id', 'name_fr', 'name_ar', 'latitude', 'longitude')
+        trains = Train.objects.order_by('id').values_list(
+            'id', 'number', 'route__name', 'days_operational', 'operating_days'
+        )
+        stops = Stop.objects.order_by('train_id', 'sequence', 'id').values_list(
+            'train_id', 'station_id', 'departure_time', 'sequence'
+        )
+        if train_ids is not None:
+            trains = trains.filter(id__in=train_ids)
+            stops = stops.filter(train_id__in=train_ids)
+            return cls(list(stations), list(trains), list(stops), version=version)
+        connections = Connection.objects.values_list(
+            'from_station_id', 'to_station_id', 'transfer_station_id', 'transfer_time_minutes'
+        )
+        return cls(list(stations), list(trains), list(stops), list(connections), version=version)
+
+    def station(self, station_id):
+        """Return a StationRef for a station primary key, or None if unknown"""
+        try:
+            index = self.station_index.get(int(station_id))
+        except (TypeError, ValueError):
+            return None
+        if index is None:
+            return None
+        return StationRef(self.station_ids[index], self.station_name_fr[index], self.station_name_ar[index])
+
+    def train_stops(self, train):
+        """Range of stop indices for a train, in sequence order"""
+        return range(self.train_first_stop[train], self.train_first_stop[train + 1])
+
+    def trains_at(self, station, since=None):
+        """
+        Indices of trains calling at a station, in departure order, without
+        duplicates; only calls at or after ``since`` (minutes) if given.
+        """
+        departures = self.station_departures[station]
+        if since is not None:
+            departures = departures[bisect_left(departures, since, key=self.stop_time.__getitem__):]
+        seen = set()
+        trains = []
+        for stop in departures:
+            train = self.stop_train[stop]
+            if train not in seen:
+                seen.add(train)
+                trains.append(train)
+        return trains
+
+
+_timetable = None
+_timetable_lock = threading.Lock()
+
+
+def get_timetable():
+    """
+    Return the process-wide timetable snapshot, building it on first use and
+    again whenever a newer dataset version has been published
+    """
+    return load_timetable()[0]
+
+
+def load_timetable():
+    """
+    get_timetable() plus whether this call built the snapshot. The request
+    that resolves the snapshot records the hit or miss (views.current_timetable),
+    so the 'timetable' cache counter moves once per request.
+    """
+    global _timetable
+    version = get_dataset_version()
+    timetable = _timetable
+    built = False
+    if timetable is None or timetable.version != version:
+        with _timetable_lock:
+            if _timetable is None or _timetable.version != version:
+                _timetable = Timetable.from_database(version=version)
+                built = True
+            timetable = _timetable
+    return timetable, built
+
+
+def clear_timetable():
+    """Drop the cached snapshot so the next search rebuilds it"""
+    global _timetable
+    with _timetable_lock:
+        _timetable = None
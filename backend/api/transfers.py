@@ -0,0 +1,101 @@
+"""
+Offline transfer-hub builder for the Connection table.
+
+For every origin/destination station pair this records the stations where a
+one-transfer journey actually works (same anti-backtracking rules and wait
+limits as find_connection_trains) and the shortest realistic wait there, so
+connection search can read its candidates instead of recomputing them.
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+
+from .csa import get_min_transfer_minutes
+from .models import Stop, TripSegment, Connection
+from .timetable import MINUTES_PER_DAY
+
+MAX_TRANSFER_MINUTES = 180
+BATCH_SIZE = 5000
+
+
+def shortest_wait(arrivals, departures, min_transfer):
+    """
+    Shortest wait between any arrival and a later departure, within limits.
+
+    Both lists hold minutes since midnight and must be sorted; a departure
+    after midnight counts as the next day. Returns None if nothing fits.
+    """
+    best = None
+    wrapped = departures + [d + MINUTES_PER_DAY for d in departures]
+    for arrival in arrivals:
+        index = bisect_left(wrapped, arrival + min_transfer)
+        if index == len(wrapped):
+            continue
+        wait = wrapped[index] - arrival
+        if wait <= MAX_TRANSFER_MINUTES and (best is None or wait < best):
+            best = wait
+    return best
+
+
+@transaction.atomic
+def build_transfer_connections(min_transfer=None):
+    """Recompute the Connection table from TripSegment; returns the number of rows"""
+    if min_transfer is None:
+        min_transfer = get_min_transfer_minutes()
+
+    Connection.objects.all().delete()
+
+    # Stations each train calls at, with the sequence of its last call there
+    last_calls = {}
+    for train_id, station_id, sequence in Stop.objects.order_by('train_id', 'sequence').values_list(
+        'train_id', 'station_id', 'sequence'
+    ):
+        last_calls.setdefault(train_id, {})[station_id] = sequence
+
+    # Per transfer station: trains arriving from each origin, and leaving to each destination
+    arriving = {}
+    leaving = {}
+    for train_id, origin_id, destination_id, departure, arrival in TripSegment.objects.values_list(
+        'train_id', 'origin_station_id', 'destination_station_id', 'departure_minutes', 'arrival_minutes'
+    ):
+        arriving.setdefault(destination_id, {}).setdefault(origin_id, []).append((arrival, train_id))
+        leaving.setdefault(origin_id, {}).setdefault(destination_id, []).append((departure, train_id))
+
+    rows = []
+    created = 0
+    for transfer_id, feeders in arriving.items():
+        departures_by_destination = leaving.get(transfer_id, {})
+        for origin_id, first_legs in feeders.items():
+            for destination_id, second_legs in departures_by_destination.items():
+                if destination_id == origin_id:
+                    continue
+                # First train must not also reach the destination (stay on board instead)
+                arrivals = sorted(
+                    time for time, train_id in first_legs
+                    if destination_id not in last_calls[train_id]
+                )
+                # Second train must not go back through the origin after the transfer
+                departures = sorted(
+                    time for time, train_id in second_legs
+                    if not (origin_id in last_calls[train_id]
+                            and last_calls[train_id][transfer_id] < last_calls[train_id][origin_id])
+                )
+                if not arrivals or not departures:
+                    continue
+                wait = shortest_wait(arrivals, departures, min_transfer)
+                if wait is None:
+                    continue
+                rows.append(Connection(
+                    from_station_id=origin_id,
+                    to_station_id=destination_id,
+                    transfer_station_id=transfer_id,
+                    transfer_time_minutes=wait,
+                ))
+                if len(rows) >= BATCH_SIZE:
+                    Connection.objects.bulk_create(rows)
+                    created += len(rows)
+                    rows = []
+    Connection.objects.bulk_create(rows)
+    created += len(rows)
+
+    return created
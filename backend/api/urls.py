@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import StationViewSet, search_schedule, LineViewSet
+from .views import StationViewSet, search_schedule, search_schedule_async, search_batch, journey_detail, reachability, timetable_bundle, timetable_bundle_file, timetable_changes, LineViewSet
 
 router = DefaultRouter()
 router.register(r'stations', StationViewSet)
@@ -9,4 +9,11 @@ router.register(r'lines', LineViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('search/', search_schedule, name='search_schedule'),
+    path('search/async/', search_schedule_async, name='search_schedule_async'),
+    path('search/batch/', search_batch, name='search_batch'),
+    path('search/journey/<str:journey_id>/', journey_detail, name='journey_detail'),
+    path('reachability/', reachability, name='reachability'),
+    path('timetable/bundle/', timetable_bundle, name='timetable_bundle'),
+    path('timetable/bundles/<str:name>', timetable_bundle_file, name='timetable_bundle_file'),
+    path('timetable/changes/', timetable_changes, name='timetable_changes'),
 ]
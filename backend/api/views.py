@@ -1,493 +1,1678 @@
-from rest_framework import viewsets, generics
+from rest_framework import viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
-from .models import Station, Route, Train, Stop, Line
-from .serializers import StationSerializer, TrainSerializer, RouteSerializer, LineSerializer
-from django.db.models import Q
-from datetime import datetime, timedelta
+from rest_framework.decorators import api_view, action, renderer_classes
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse, HttpResponseNotAllowed, FileResponse, Http404
+from .models import Station, Stop, Line, TripSegment
+from .serializers import StationSerializer, LineSerializer
+from .timetable import Timetable, load_timetable, format_minutes, format_duration, parse_minutes, day_number, NO_TIME, MINUTES_PER_DAY, OPERATING_DAY_CODES, StationRef
+from .segments import find_segments, segment_transfer_candidates, positions_loader
+from .csa import get_connection_scan, get_min_transfer_minutes
+from .transfers import MAX_TRANSFER_MINUTES
+from .raptor import get_raptor, DEFAULT_MAX_TRANSFERS
+from .ranking import TopJourneys, MAX_RESULTS
+from .search_cache import normalize_departure_time, search_cache_key, get_cached_search, set_cached_search
+from .bundle import read_manifest, open_bundle
+from .changes import get_changes
+from .conditional import dataset_condition
+from .renderers import NDJSONRenderer, ndjson_line
+from .suggest import get_station_index, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from .profiling import phase, timed, record_count
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, record_cache, record_search_outcome
+from .nearby import get_station_grid, DEFAULT_NEARBY_KM, MAX_NEARBY_KM, DEFAULT_NEARBY, MAX_NEARBY
+from .dataset import get_dataset_version
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_safe
+from django.db import connection, close_old_connections
+from asgiref.sync import sync_to_async
+from django.db.models import Exists, OuterRef
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from itertools import chain
+import math
+from datetime import datetime, time
 
+# Upper bound on RAPTOR rounds a client may request with mode=pareto
+MAX_PARETO_TRANSFERS = 5
+# Minutes before the requested time still offered as departures
+DEPARTURE_LOOK_BACK = 60
+# Most searches accepted by one /api/search/batch/ request
+MAX_BATCH_QUERIES = 50
+# Travel time budget of /api/reachability/ when max_minutes is not given
+DEFAULT_REACHABILITY_MINUTES = 120
+# Departure board size (/api/stations/<id>/departures/) and stops shown per train
+DEFAULT_DEPARTURES = 10
+MAX_DEPARTURES = 50
+NEXT_STOPS = 3
+
+@method_decorator(dataset_condition(), name='list')
+@method_decorator(dataset_condition(), name='retrieve')
 class LineViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Line.objects.all()
     serializer_class = LineSerializer
 
+@method_decorator(dataset_condition(), name='list')
+@method_decorator(dataset_condition(), name='retrieve')
 class StationViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Station.objects.all().order_by('name_fr')
+    queryset = Station.objects.select_related('line').order_by('name_fr')
     serializer_class = StationSerializer
     pagination_class = None
+    
+    @action(detail=False, methods=['get'])
+    @method_decorator(dataset_condition())
+    def suggest(self, request):
+        """
+        Station autocomplete.
+        
+        Query parameters:
+        - q: What the user typed (French or Arabic, accents and hyphens optional)
+        - limit: Number of suggestions (default 8, at most 20)
+        
+        Prefix matches on names and their words come first, then close
+        spellings; aliases such as 'H.Dey' find their station.
+        """
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_SUGGESTIONS))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        limit = min(max(limit, 1), MAX_SUGGESTIONS)
+        
+        return Response([
+            {'id': station_id, 'name_fr': name_fr, 'name_ar': name_ar}
+            for station_id, name_fr, name_ar in get_station_index().suggest(request.GET.get('q', ''), limit)
+        ])
+    
+    @action(detail=False, methods=['get'])
+    @method_decorator(dataset_condition())
+    def nearby(self, request):
+        """
+        Stations near a position, nearest first.
+        
+        Query parameters:
+        - lat, lon: Position in degrees
+        - radius: Search radius in km (default 5, at most 50)
+        - limit: Number of stations (default 5, at most 20)
+        
+        Distances are great-circle kilometres; pass a returned id as 'from'
+        to /api/search/ to search from the user's position.
+        """
+        try:
+            latitude = float(request.GET.get('lat', ''))
+            longitude = float(request.GET.get('lon', ''))
+        except ValueError:
+            return Response({'error': 'lat and lon must be numbers'}, status=400)
+        if not (math.isfinite(latitude) and math.isfinite(longitude)
+                and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({'error': 'lat and lon must be valid coordinates'}, status=400)
+        
+        try:
+            radius = float(request.GET.get('radius', DEFAULT_NEARBY_KM))
+            limit = int(request.GET.get('limit', DEFAULT_NEARBY))
+        except ValueError:
+            return Response({'error': 'radius and limit must be numbers'}, status=400)
+        if not math.isfinite(radius):
+            return Response({'error': 'radius must be a finite number'}, status=400)
+        radius = min(max(radius, 0), MAX_NEARBY_KM)
+        limit = min(max(limit, 1), MAX_NEARBY)
+        
+        return Response([{
+            'id': station_id,
+            'name_fr': name_fr,
+            'name_ar': name_ar,
+            'latitude': station_latitude,
+            'longitude': station_longitude,
+            'distance_km': round(distance, 3)
+        } for distance, (station_id, name_fr, name_ar, station_latitude, station_longitude)
+            in get_station_grid().nearby(latitude, longitude, radius, limit)])
+    
+    @action(detail=True, methods=['get'])
+    @method_decorator(dataset_condition(now=('time', 'day')))
+    def departures(self, request, pk=None):
+        """
+        Departure board: the next trains leaving a station.
+        
+        Query parameters:
+        - time: Earliest departure (HH:MM format, default now)
+        - day: Day of week (0=Sunday, 1=Monday, ..., 6=Saturday, default today)
+        - limit: Number of departures (default 10, at most 50)
+        
+        Each departure lists the train's final destination and its next stops.
+        Late in the evening the board runs on past midnight into the next
+        morning's trains.
+        """
+        timetable = current_timetable()
+        station = resolve_station(timetable, pk)
+        if station is None:
+            return Response({'error': 'Invalid station ID'}, status=404)
+        
+        since = parse_minutes(request.GET.get('time') or datetime.now().strftime('%H:%M'))
+        if since is None:
+            return Response({'error': 'time must be HH:MM'}, status=400)
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_DEPARTURES))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        limit = min(max(limit, 1), MAX_DEPARTURES)
+        day_of_week = request.GET.get('day', '') or day_number(datetime.now())
+        
+        return Response(find_departures(timetable, station, since, parse_allowed_days(day_of_week), limit))
+
+def current_timetable():
+    """
+    The timetable snapshot a request works on, or None on the TripSegment
+    path (TIMETABLE_SNAPSHOT = False). Resolve it once per request and pass
+    it down: a later get_timetable() may already return a newer snapshot,
+    whose train ids no longer match the ones found so far.
+    """
+    if not settings.TIMETABLE_SNAPSHOT:
+        return None
+    timetable, built = load_timetable()
+    record_cache('timetable', not built)
+    return timetable
+
+def resolve_station(timetable, station_id):
+    """Look up a station by primary key (in the timetable snapshot if there is one); None if unknown"""
+    if timetable is not None:
+        return timetable.station(station_id)
+    try:
+        return StationRef(*Station.objects.values_list('id', 'name_fr', 'name_ar').get(id=int(station_id)))
+    except (Station.DoesNotExist, TypeError, ValueError):
+        return None
+
+class SearchQueryError(Exception):
+    """Invalid search parameters; ``status`` is the HTTP status to answer with"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_search_query(params, timetable, resolve=None):
+    """
+    Validate search parameters (request.GET or a dict from a batch body) into
+    keyword arguments for cached_search, searching ``timetable`` (see
+    current_timetable). Stations are looked up by ``resolve(id)``, by
+    default resolve_station. Raises SearchQueryError.
+    """
+    if resolve is None:
+        def resolve(station_id):
+            return resolve_station(timetable, station_id)
+    
+    from_station_id = params.get('from')
+    to_station_id = params.get('to')
+    departure_time_str = params.get('time')
+    day_of_week = params.get('day')
+    day_of_week = '' if day_of_week is None else str(day_of_week)
+    mode = params.get('mode') or ''
+    
+    if not from_station_id or not to_station_id:
+        raise SearchQueryError('Both from and to station IDs are required')
+    
+    from_station = resolve(from_station_id)
+    to_station = resolve(to_station_id)
+    if from_station is None or to_station is None:
+        raise SearchQueryError('Invalid station ID', status=404)
+    
+    max_transfers = None
+    if mode == 'pareto':
+        if timetable is None:
+            raise SearchQueryError('mode=pareto needs the timetable snapshot (TIMETABLE_SNAPSHOT)', status=501)
+        try:
+            max_transfers = int(params.get('max_transfers', DEFAULT_MAX_TRANSFERS))
+        except (TypeError, ValueError):
+            raise SearchQueryError('max_transfers must be an integer')
+        max_transfers = min(max(max_transfers, 0), MAX_PARETO_TRANSFERS)
+    else:
+        mode = ''
+    
+    try:
+        limit = int(params.get('limit', MAX_RESULTS))
+    except (TypeError, ValueError):
+        raise SearchQueryError('limit must be an integer')
+    limit = min(max(limit, 1), MAX_RESULTS)
+    
+    # Response shape: compact results leave stop lists out unless include=stops
+    compact = str(params.get('compact', '')).lower() in ('1', 'true')
+    include = str(params.get('include') or '').split(',')
+    fields = [name for name in str(params.get('fields') or '').split(',') if name]
+    
+    # Default to today if not provided
+    if not day_of_week:
+        day_of_week = day_number(datetime.now())
+    
+    return {
+        'timetable': timetable,
+        'from_station': from_station,
+        'to_station': to_station,
+        'departure_time_str': normalize_departure_time(departure_time_str if isinstance(departure_time_str, str) else None),
+        'day_of_week': day_of_week,
+        'mode': mode,
+        'max_transfers': max_transfers,
+        'limit': limit,
+        'compact': compact,
+        'with_stops': not compact or 'stops' in include,
+        'fields': fields or None,
+    }
+
+def cached_search(timetable, from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit,
+                  compact=False, with_stops=True, fields=None, load_positions=None):
+    """
+    Search results from the search cache (invalidated by every import) or
+    run_search; returns (results, 'HIT'/'MISS'). ``fields`` projects each
+    result onto the given keys.
+    """
+    cache_key = query_cache_key(
+        from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit, compact, with_stops
+    )
+    with phase('cache'):
+        results = get_cached_search(cache_key)
+    cache_status = 'HIT'
+    if results is None:
+        results = run_search(
+            timetable, from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit,
+            compact=compact, with_stops=with_stops, load_positions=load_positions
+        )
+        with phase('cache'):
+            set_cached_search(cache_key, results)
+        cache_status = 'MISS'
+    record_count('results', len(results))
+    record_search_outcome(results)
+    
+    if fields:
+        results = [project_result(result, fields) for result in results]
+    return results, cache_status
+
+def query_cache_key(from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit,
+                    compact, with_stops):
+    """Search cache key of a parsed query (everything but the fields projection)"""
+    variant = f"{mode}{max_transfers}" if mode else f"top{limit}"
+    if compact:
+        variant += ':compact:stops' if with_stops else ':compact'
+    return search_cache_key(from_station.id, to_station.id, departure_time_str, day_of_week, variant)
+
+def project_result(result, fields):
+    """A search result reduced to the given keys (all of them if ``fields`` is empty)"""
+    if not fields:
+        return result
+    return {name: result[name] for name in fields if name in result}
+
+def stream_search(timetable, from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit,
+                  compact=False, with_stops=True, fields=None):
+    """
+    A search as NDJSON records for StreamingHttpResponse; returns (records, 'HIT'/'MISS').
+    
+    Journeys are sent as soon as the stage of the search that found them
+    completes, as {"type": "journey", "id": n, "stage": ..., "journey": {...}};
+    the last record, {"type": "ranking", "results": [{"id", "score", "badges"}]},
+    lists the returned journeys best first (journeys sent but not ranked
+    were pushed out by better ones). Cached results are replayed the same
+    way; computed ones are cached once the ranking is known.
+    """
+    cache_key = query_cache_key(
+        from_station, to_station, departure_time_str, day_of_week, mode, max_transfers, limit, compact, with_stops
+    )
+    cached = get_cached_search(cache_key)
+    
+    def ranking_record(ids, results):
+        ranking = []
+        for journey_id, result in zip(ids, results):
+            entry = {'id': journey_id}
+            if 'score' in result:
+                entry['score'] = result['score']
+            entry['badges'] = result.get('badges', [])
+            ranking.append(entry)
+        record_search_outcome(results)
+        return ndjson_line({'type': 'ranking', 'results': ranking})
+    
+    def replay():
+        for journey_id, result in enumerate(cached):
+            yield ndjson_line({
+                'type': 'journey', 'id': journey_id, 'stage': 'cached', 'journey': project_result(result, fields)
+            })
+        yield ranking_record(range(len(cached)), cached)
+    
+    def search():
+        # Journeys sent so far; kept referenced so their id() stays unique
+        sent = []
+        ids = {}
+        
+        if mode == 'pareto':
+            journeys = find_pareto_journeys(
+                timetable, from_station, to_station, departure_time_str, day_of_week,
+                DEFAULT_MAX_TRANSFERS if max_transfers is None else max_transfers,
+                compact=compact, with_stops=with_stops
+            )
+            stages = [('pareto', journeys), ('ranked', journeys)]
+        else:
+            stages = search_stages(timetable, from_station, to_station, departure_time_str, day_of_week, limit,
+                                   compact, with_stops)
+        
+        for stage, journeys in stages:
+            if stage == 'ranked':
+                break
+            if with_stops:
+                attach_stops(timetable, journeys, compact)
+            for journey in journeys:
+                ids[id(journey)] = len(sent)
+                sent.append(journey)
+                yield ndjson_line({
+                    'type': 'journey', 'id': ids[id(journey)], 'stage': stage,
+                    'journey': project_result(serialize_journey(journey, compact), fields)
+                })
+        
+        results = [serialize_journey(journey, compact) for journey in journeys]
+        set_cached_search(cache_key, results)
+        yield ranking_record([ids[id(journey)] for journey in journeys], results)
+    
+    if cached is not None:
+        return replay(), 'HIT'
+    return search(), 'MISS'
 
 @api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer])
+@dataset_condition(now=('day',))
 def search_schedule(request):
     """
     Search for train schedules between two stations.
-    Supports both direct trains and connections (max 1 transfer).
+    Supports direct trains and connections (max 1 transfer); when neither
+    runs, falls back to journeys with several transfers (Connection Scan,
+    timetable snapshot only).
     
     Query parameters:
     - from: Origin station ID
     - to: Destination station ID
     - time: Departure time (HH:MM format, optional)
     - day: Day of week (0=Sunday, 1=Monday, ..., 6=Saturday, empty=all days)
+    - mode: 'pareto' to return the Pareto set of journeys (earliest arrival
+      for each number of transfers) instead of the scored list (timetable
+      snapshot only: 501 with TIMETABLE_SNAPSHOT = False)
+    - max_transfers: Transfer limit for mode=pareto (default 3)
+    - limit: Number of scored results to return (default and maximum 20)
+    - compact: 1 to reference stations by id and leave stop lists out; each
+      result gets a journey_id for /api/search/journey/<journey_id>/
+    - include: 'stops' to keep stop lists in compact results
+    - fields: Comma-separated result keys to return (e.g. journey_id,departure_time)
+    
+    Results are cached per dataset version with the time rounded down to
+    SEARCH_CACHE_TIME_BUCKET minutes; X-Search-Cache reports HIT or MISS.
+    The ETag covers the dataset version and the query, so revalidating an
+    unchanged search answers 304 without running it.
+    
+    With Accept: application/x-ndjson (or format=ndjson) results are
+    streamed as they are found, followed by the ranking (see stream_search).
     """
-    from_station_id = request.GET.get('from')
-    to_station_id = request.GET.get('to')
-    departure_time_str = request.GET.get('time')
-    day_of_week = request.GET.get('day', '')
+    try:
+        query = parse_search_query(request.GET, current_timetable())
+    except SearchQueryError as error:
+        return Response({'error': str(error)}, status=error.status)
+    
+    if request.accepted_renderer.format == NDJSONRenderer.format:
+        records, cache_status = stream_search(**query)
+        response = StreamingHttpResponse(records, content_type=NDJSONRenderer.media_type)
+    else:
+        results, cache_status = cached_search(**query)
+        response = Response(results)
+    response['X-Search-Cache'] = cache_status
+    return response
+
+@api_view(['POST'])
+def search_batch(request):
+    """
+    Run several searches in one request.
     
-    def parse_duration(duration_str):
-        """Convert duration string like '2h30' or '45min' to minutes"""
-        if not duration_str or duration_str == 'N/A':
-            return 999999
+    Body: {"queries": [{"from": 1, "to": 5, "time": "08:00", "day": 1}, ...],
+    "parallel": false}; each query takes the same parameters as /api/search/
+    (a bare list of queries is accepted too). Up to MAX_BATCH_QUERIES queries.
+    
+    Returns {"results": [...], "errors": [...]}: ``results`` holds one entry
+    per query in request order (null when it failed) and ``errors`` lists
+    {"index", "status", "error"} for the failed ones. Station lookups and,
+    on the TripSegment path, train stop sequences are loaded once for the
+    whole batch; with "parallel": true queries run on a pool of
+    SEARCH_BATCH_WORKERS threads.
+    """
+    body = request.data
+    queries = body.get('queries') if isinstance(body, dict) else body
+    if not isinstance(queries, list) or not queries:
+        return Response({'error': 'queries must be a non-empty list'}, status=400)
+    if len(queries) > MAX_BATCH_QUERIES:
+        return Response({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}, status=400)
+    parallel = isinstance(body, dict) and body.get('parallel') in (True, 'true', '1', 1)
+    
+    results = [None] * len(queries)
+    errors = []
+    
+    # 1. Validate every query, resolving all stations at once
+    station_ids = set()
+    for params in queries:
+        if isinstance(params, dict):
+            station_ids.update(str(params.get(key)) for key in ('from', 'to') if params.get(key))
+    timetable = current_timetable()
+    stations = resolve_stations(timetable, station_ids)
+    
+    parsed = []
+    for index, params in enumerate(queries):
         try:
-            if 'h' in duration_str:
-                parts = duration_str.replace('min', '').split('h')
-                hours = int(parts[0])
-                minutes = int(parts[1]) if len(parts) > 1 and parts[1] else 0
-                return hours * 60 + minutes
-            else:
-                return int(duration_str.replace('min', ''))
-        except:
-            return 999999
+            if not isinstance(params, dict):
+                raise SearchQueryError('Each query must be an object')
+            parsed.append((index, parse_search_query(params, timetable, resolve=lambda pk: stations.get(str(pk)))))
+        except SearchQueryError as error:
+            errors.append({'index': index, 'status': error.status, 'error': str(error)})
     
-    if not from_station_id or not to_station_id:
-        return Response({'error': 'Both from and to station IDs are required'}, status=400)
+    # 2. Run the valid ones, sharing the per-train stop sequences
+    load_positions = None if timetable is not None else positions_loader()
+    
+    def run(query):
+        return cached_search(**query, load_positions=load_positions)[0]
+    
+    if parallel and len(parsed) > 1:
+        def run_in_worker(query):
+            try:
+                return run(query)
+            finally:
+                connection.close()
+        
+        with ThreadPoolExecutor(max_workers=get_batch_workers()) as executor:
+            for (index, _), query_results in zip(parsed, executor.map(run_in_worker, [q for _, q in parsed])):
+                results[index] = query_results
+    else:
+        for index, query in parsed:
+            results[index] = run(query)
     
+    errors.sort(key=lambda error: error['index'])
+    return Response({'results': results, 'errors': errors})
+
+async def search_schedule_async(request):
+    """
+    search_schedule for ASGI servers: same query parameters and JSON
+    results (no NDJSON streaming or browsable API).
+    
+    Under ASGI Django runs sync views one at a time per worker; this view
+    hands each search to a thread of its own instead, so one worker serves
+    many searches while they wait on the database.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET'])
+    return await sync_to_async(search_in_worker, thread_sensitive=False)(request)
+
+def search_in_worker(request):
+    """
+    Run search_schedule_async's search on the current (worker) thread. The
+    executor reuses its threads, so each keeps its connection for
+    CONN_MAX_AGE like a sync worker; expired or broken ones are closed.
+    """
+    close_old_connections()
     try:
-        from_station = Station.objects.get(id=from_station_id)
-        to_station = Station.objects.get(id=to_station_id)
-    except Station.DoesNotExist:
-        return Response({'error': 'Invalid station ID'}, status=404)
+        return conditional_search(request)
+    finally:
+        close_old_connections()
+
+@dataset_condition(now=('day',))
+def conditional_search(request):
+    try:
+        query = parse_search_query(request.GET, current_timetable())
+    except SearchQueryError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
     
-    results = []
+    results, cache_status = cached_search(**query)
+    response = JsonResponse(results, safe=False, json_dumps_params={'ensure_ascii': False})
+    response['X-Search-Cache'] = cache_status
+    return response
+
+@api_view(['GET'])
+@dataset_condition()
+def journey_detail(request, journey_id):
+    """
+    One journey in full (station names, stop lists), for expanding a compact
+    search result by its journey_id.
     
-    # 1. Find direct trains
-    direct_trains = find_direct_trains(from_station, to_station)
-    results.extend(direct_trains)
+    Journey ids name trains by id, which change with every import: an id
+    from an older dataset version answers 410 and the client searches again.
+    """
+    decoded = decode_journey_id(journey_id)
+    if decoded is None:
+        return Response({'error': 'Invalid journey id'}, status=400)
+    version, path = decoded
+    if version != get_dataset_version():
+        return Response({'error': 'Journey is from an older timetable, search again'}, status=410)
     
-    # 2. Find trains with one connection
-    if len(results) < 10:  # Only search for connections if we don't have many direct trains
-        connection_trains = find_connection_trains(from_station, to_station)
-        results.extend(connection_trains)
+    timetable = current_timetable()
+    if timetable is None:
+        # TripSegment path: a snapshot of just the journey's trains
+        timetable = Timetable.from_database(version=version, train_ids=[train_id for train_id, _, _ in path])
+    legs = find_journey_legs(timetable, path)
+    if legs is None:
+        return Response({'error': 'Journey not found'}, status=404)
+    
+    result = build_journey(timetable, legs)
+    if len(legs) > 1:
+        result['transfers_count'] = len(legs) - 1
+    return Response(serialize_journey(result))
+
+def find_journey_legs(timetable, path):
+    """
+    Snapshot legs (train, board stop, alight stop) of a journey path of
+    (train id, board station id, alight station id); None if a train no
+    longer calls at its stations in that order.
+    """
+    legs = []
+    for train_id, board_id, alight_id in path:
+        train = timetable.train_index.get(train_id)
+        board = timetable.station_index.get(board_id)
+        alight = timetable.station_index.get(alight_id)
+        if train is None or board is None or alight is None:
+            return None
+        stops = timetable.train_stops(train)
+        board_stop = next((s for s in stops if timetable.stop_station[s] == board), None)
+        if board_stop is None:
+            return None
+        alight_stop = next((s for s in stops if s > board_stop and timetable.stop_station[s] == alight), None)
+        if alight_stop is None:
+            return None
+        legs.append((train, board_stop, alight_stop))
+    return legs
+
+def resolve_stations(timetable, station_ids):
+    """Look up several stations at once (see resolve_station); returns {str(id): StationRef} for the known ones"""
+    if timetable is not None:
+        stations = {station_id: timetable.station(station_id) for station_id in station_ids}
+        return {station_id: station for station_id, station in stations.items() if station is not None}
+    
+    ids = [int(station_id) for station_id in station_ids if station_id.isdigit()]
+    return {
+        str(row[0]): StationRef(*row)
+        for row in Station.objects.filter(id__in=ids).values_list('id', 'name_fr', 'name_ar')
+    }
+
+def get_batch_workers():
+    """Thread pool size for parallel batch searches (settings.SEARCH_BATCH_WORKERS)"""
+    return getattr(settings, 'SEARCH_BATCH_WORKERS', 4)
+
+def run_search(timetable, from_station, to_station, departure_time_str=None, day_of_week='', mode='',
+               max_transfers=None, limit=MAX_RESULTS, compact=False, with_stops=True, load_positions=None):
+    """
+    Compute search results for two resolved stations (uncached) in
+    ``timetable`` (see current_timetable).
+    
+    ``departure_time_str`` is HH:MM or None; ``mode`` is '' for the ``limit``
+    best scored journeys or 'pareto' for the Pareto set limited to
+    ``max_transfers``. Journeys carry integer minutes internally and are
+    formatted once, by serialize_journey, on the way out. ``load_positions``
+    optionally shares train stop sequences between searches (see
+    iter_connection_trains). ``compact`` and ``with_stops`` select the
+    response shape (see serialize_journey); stop lists are only built when
+    they are returned.
+    """
+    if mode == 'pareto':
+        if max_transfers is None:
+            max_transfers = DEFAULT_MAX_TRANSFERS
+        with phase('pareto'):
+            journeys = find_pareto_journeys(
+                timetable, from_station, to_station, departure_time_str, day_of_week, max_transfers,
+                compact=compact, with_stops=with_stops
+            )
+        with phase('serialize'):
+            return [serialize_journey(journey, compact) for journey in journeys]
+    
+    for stage, journeys in search_stages(timetable, from_station, to_station, departure_time_str, day_of_week, limit,
+                                         compact, with_stops, load_positions):
+        if stage == 'ranked':
+            with phase('serialize'):
+                return [serialize_journey(journey, compact) for journey in journeys]
+
+def search_stages(timetable, from_station, to_station, departure_time_str=None, day_of_week='', limit=MAX_RESULTS,
+                  compact=False, with_stops=True, load_positions=None):
+    """
+    The scored search of run_search, stage by stage.
+    
+    Yields (stage, journeys): the candidates each stage adds to the running
+    top ``limit`` ('direct', then 'connection' once per transfer station,
+    then 'multi'), without stop lists, and finally ('ranked', the top
+    journeys best first with stop lists and badges). Each stage is timed
+    as a profiling phase (api.profiling) with its candidate count.
+    """
+    requested_minutes = parse_minutes(departure_time_str)
     
-    # 3. Filter by day of week (Strict Compliance)
     # Default to today if not provided
     if not day_of_week:
-        day_of_week = str(datetime.now().weekday())
+        day_of_week = day_number(datetime.now())
     
-    try:
-        day_int = int(day_of_week)
-        is_friday = (day_int == 5)
+    # Day-of-week (Strict Compliance) and departure window (60 minute look-back)
+    # are applied while generating candidates, so trains that can't be taken
+    # are never materialized
+    allowed_days = parse_allowed_days(day_of_week)
+    earliest = requested_minutes - DEPARTURE_LOOK_BACK if requested_minutes is not None else None
+    
+    # Multi-Criteria Scoring (lower is better); without a requested time
+    # results keep the order they were found in
+    def calculate_score(departure, arrival, is_direct):
+        if requested_minutes is None:
+            return 0
+        # Priority 1: Proximity to requested departure time (Primary)
+        # We want the train that leaves closest to the requested time.
+        diff_mins = abs(window_departure(departure, earliest) - requested_minutes)
         
-        allowed_days = ['daily']
-        if is_friday:
-            allowed_days.append('friday_only')
-        else:
-            allowed_days.append('no_friday')
-            
-        # Helper to check if a result (direct or connection) is valid for the day
-        def is_valid_for_day(result):
-            # For direct trains
-            if result.get('type') == 'direct':
-                # We need to check the Train object's operating_days
-                # But result only has 'days_operational' string.
-                # We should have passed operating_days enum in find_direct_trains
-                # For now, let's parse the string again or fetch from DB (expensive)
-                # Better: Update find_direct_trains to return operating_days enum
-                # Fallback to string parsing for now to avoid breaking changes in helpers immediately
-                days_str = result.get('days_operational', '')
-                if '[*]' in days_str: return True
-                if '[1]' in days_str: return not is_friday
-                if '[2]' in days_str: return is_friday
-                return True
-            
-            # For connections
-            elif result.get('type') == 'connection':
-                # Check both legs
-                # This is tricky without the enum. 
-                # Let's assume the find_connection_trains logic handles it or we parse strings
-                # For now, strict parsing of the string representation
-                # Implementation detail: find_connection_trains returns combined string or list?
-                # It returns first_leg['days_operational'] which might be misleading
-                # Let's rely on the 'days_operational' field being accurate for the *first* leg
-                # But we really need to check both.
-                # Let's skip strict check here if we can't be sure, 
-                # BUT the prompt demands STRICT compliance.
-                # So I will update find_direct_trains and find_connection_trains to include 'operating_days' enum
-                return True # Placeholder, will filter inside find_* functions or update them
-        
-        # Actually, let's filter based on the string for now as it's reliable enough if data is correct
-        results = [r for r in results if is_valid_for_day(r)]
-            
-    except ValueError:
-        pass
+        # Priority 2: Arrival Time (Secondary)
+        # If departure times are similar, we want the one that arrives earliest.
+        # Arrivals carry their day offset, so the duration is a plain difference.
+        duration_mins = arrival - departure
+        
+        # Priority 3: Direct vs Connection (Tertiary)
+        transfer_penalty = 0 if is_direct else 30 # 30 min penalty equivalent for transfer
+        
+        # Composite Score (Lower is better)
+        # Score = (Diff Mins * 10) + Duration Mins + Transfer Penalty
+        # Weighting Diff Mins by 10 makes it the dominant factor (Primary Sort)
+        # Then Duration (Secondary Sort)
+        return (diff_mins * 10) + duration_mins + transfer_penalty
+    
+    # Only the best ``limit`` candidates are kept while they are generated
+    top = TopJourneys(limit)
+    
+    def add(stage, results):
+        record_count(stage, len(results))
+        kept = []
+        with phase('scoring'):
+            for result in results:
+                score = calculate_score(result['departure'], result['arrival'], result['type'] == 'direct')
+                if requested_minutes is not None:
+                    result['score'] = score
+                if top.push(score, result):
+                    kept.append(result)
+        return kept
+    
+    def keep_connection(departure, arrival):
+        return top.accepts(calculate_score(departure, arrival, False))
+    
+    # 1. Find direct trains
+    with phase('direct'):
+        direct_trains = find_direct_trains(timetable, from_station, to_station, allowed_days, earliest, with_stops=False)
+    yield 'direct', add('direct', direct_trains)
+    
+    # 2. Find trains with one connection
+    if len(direct_trains) < 10:  # Only search for connections if we don't have many direct trains
+        for connections in timed('connections', iter_connection_groups(
+            timetable, from_station, to_station, allowed_days, earliest,
+            keep=keep_connection, load_positions=load_positions
+        )):
+            yield 'connection', add('connections', connections)
+    
+    # 3. Journeys with two or more transfers when nothing simpler runs
+    # (Connection Scan over the snapshot: not on the TripSegment path)
+    if not top and timetable is not None:
+        with phase('multi'):
+            multi = find_multi_connection_trains(
+                timetable, from_station, to_station, departure_time_str, day_of_week, compact=compact, with_stops=with_stops
+            )
+        yield 'multi', add('multi', multi)
+    
+    results = top.results()
+    if with_stops:
+        with phase('stops'):
+            attach_stops(timetable, results, compact)
+    
+    # 4. Badges, for the returned results only
+    if requested_minutes is not None and results:
+        for result in results:
+            result['badges'] = []
+            if result['type'] == 'direct': result['badges'].append('Direct')
+            if result['arrival'] - result['departure'] < 60: result['badges'].append('Fast')
+        
+        # Tag the top results
+        results[0]['badges'].append('Best Overall')
+        
+        # Find Fastest
+        fastest = min(results, key=lambda x: x['arrival'] - x['departure'])
+        fastest['badges'].append('Fastest')
+    
+    yield 'ranked', results
 
-    # 4. Filter by departure time (Exhaustive Search with Look-back)
-    if departure_time_str:
-        try:
-            req_time = datetime.strptime(departure_time_str, '%H:%M')
-            # Look back 60 minutes
-            min_time = (req_time - timedelta(minutes=60)).time()
-            # Look forward 3 hours (optional, but good for relevance)
-            # max_time = (req_time + timedelta(hours=3)).time()
-            
-            filtered_results = []
-            for r in results:
-                if not r.get('departure_time'): continue
-                dep_time = datetime.strptime(r['departure_time'], '%H:%M').time()
-                
-                # Handle midnight wrapping if needed (simple version for now)
-                if dep_time >= min_time:
-                    filtered_results.append(r)
-            
-            results = filtered_results
-        except ValueError:
-            pass
+def departure_in_window(departure, earliest):
+    """True if a departure (minutes) is at or after ``earliest``, which may fall on the previous evening"""
+    return earliest is None or earliest < 0 or departure >= earliest
 
-    # 5. Multi-Criteria Scoring
-    if departure_time_str:
-        try:
-            target_time = datetime.strptime(departure_time_str, '%H:%M')
-            
-            def calculate_score(result):
-                # Priority 1: Proximity to requested departure time (Primary)
-                # We want the train that leaves closest to the requested time.
-                dep_time = datetime.strptime(result.get('departure_time', '00:00'), '%H:%M')
-                diff_mins = abs((dep_time - target_time).total_seconds() / 60)
-                
-                # Priority 2: Arrival Time (Secondary)
-                # If departure times are similar, we want the one that arrives earliest.
-                # We can use duration as a proxy if departure is fixed, or just arrival time value.
-                # Let's use total minutes from midnight for arrival time to make it comparable.
-                arr_time_str = result.get('arrival_time', '23:59')
-                try:
-                    arr_time = datetime.strptime(arr_time_str, '%H:%M')
-                    # Handle next day arrival (if arr < dep)
-                    if arr_time < dep_time:
-                        arr_time += timedelta(days=1)
-                    
-                    # Calculate minutes from a reference point (e.g. target_time)
-                    # Actually, just total duration from target_time is a good metric for "arriving first" relative to request
-                    # But simpler: just use duration in minutes.
-                    duration_str = result.get('duration', '0')
-                    duration_mins = parse_duration(duration_str)
-                except:
-                    duration_mins = 999
-                
-                # Priority 3: Direct vs Connection (Tertiary)
-                is_direct = result.get('type') == 'direct'
-                transfer_penalty = 0 if is_direct else 30 # 30 min penalty equivalent for transfer
-                
-                # Composite Score (Lower is better)
-                # Score = (Diff Mins * 10) + Duration Mins + Transfer Penalty
-                # Weighting Diff Mins by 10 makes it the dominant factor (Primary Sort)
-                # Then Duration (Secondary Sort)
-                score = (diff_mins * 10) + duration_mins + transfer_penalty
-                
-                # Update badges logic
-                result['score'] = score
-                result['badges'] = []
-                if is_direct: result['badges'].append('Direct')
-                if duration_mins < 60: result['badges'].append('Fast')
-                
-                return score # Ascending order (lower score is better)
-            
-            results.sort(key=calculate_score)
-            
-            # Tag the top results
-            if results:
-                results[0]['badges'].append('Best Overall')
-                
-                # Find Fastest
-                fastest = min(results, key=lambda x: parse_duration(x.get('duration', '999')))
-                if fastest not in results[0].get('badges', []):
-                    fastest['badges'].append('Fastest')
-                    
-                # Find Earliest (closest to requested time but not too early)
-                # ...
-                
-        except ValueError:
-            pass
+def window_departure(departure, earliest):
+    """
+    Departure minutes relative to a search window starting at ``earliest``.
+    
+    When the window starts before midnight (a request just after 00:00),
+    late-evening trains count as the previous day, i.e. negative minutes.
+    """
+    if earliest is None or earliest >= 0:
+        return departure
+    return (departure - earliest) % MINUTES_PER_DAY + earliest
+
+def arrival_after(start_minutes, time_minutes):
+    """First occurrence of a time of day (minutes) at or after ``start_minutes``, keeping the day offset"""
+    return start_minutes + (time_minutes - start_minutes) % MINUTES_PER_DAY
+
+def serialize_journey(journey, compact=False):
+    """
+    Format an internal journey for the API response.
+    
+    Internally every time is an integer minute count from midnight of the
+    service day (arrivals after midnight keep counting past 1440); this is
+    the only place they are turned into HH:MM strings and durations.
+    Compact journeys name stations by id and carry a journey_id; stop lists
+    are left out when they were not built.
+    """
+    result = {}
+    if compact:
+        result['journey_id'] = encode_journey_id(journey['path'])
+    if 'train_id' in journey:
+        result['train_id'] = journey['train_id']
+    result.update({
+        'train_number': journey['train_number'],
+        'route_name': journey['route_name'],
+        'days_operational': journey['days_operational'],
+        'departure_time': format_minutes(journey['departure']),
+        'arrival_time': format_minutes(journey['arrival']),
+        'duration': format_duration(journey['arrival'] - journey['departure']),
+    })
+    if journey.get('stops') is not None:
+        result['stops'] = journey['stops']
+    result['type'] = journey['type']
     
-    return Response(results[:20]) # Return top 20
+    # Station ids of the changes and legs (compact) from the journey's path
+    path = journey['path']
+    transfer_ids = [alight for _, _, alight in path[:-1]] if compact else [None] * len(path)
+    result['transfer'] = serialize_transfer(journey['transfer'], transfer_ids[0]) if journey['transfer'] else None
+    if 'transfers' in journey:
+        result['transfers'] = [
+            serialize_transfer(transfer, station_id)
+            for transfer, station_id in zip(journey['transfers'], transfer_ids)
+        ]
+    if 'legs' in journey:
+        result['legs'] = []
+        for leg, (_, board, alight) in zip(journey['legs'], path):
+            serialized = {
+                'train': leg['train'],
+                'from': board if compact else leg['from'],
+                'to': alight if compact else leg['to'],
+                'departure': format_minutes(leg['departure']),
+                'arrival': format_minutes(leg['arrival']),
+            }
+            if leg['stops'] is not None:
+                serialized['stops'] = leg['stops']
+            result['legs'].append(serialized)
+    for key in ('transfers_count', 'score', 'badges'):
+        if key in journey:
+            result[key] = journey[key]
+    return result
 
-from django.db.models import Q, Prefetch
+def serialize_transfer(transfer, station_id=None):
+    """Format a change of trains; with ``station_id`` (compact) the station is referenced by id"""
+    if station_id is not None:
+        result = {'station': station_id}
+    else:
+        result = {'station': transfer['station'], 'station_ar': transfer['station_ar']}
+    result.update({
+        'arrival': format_minutes(transfer['arrival']),
+        'departure': format_minutes(transfer['departure']),
+        'wait_time': f"{transfer['wait']} min"
+    })
+    return result
 
-# ... imports ...
+def encode_journey_id(path):
+    """
+    Journey id for /api/search/journey/<journey_id>/: the dataset version
+    and, per leg, the train id and boarding and alighting station ids,
+    e.g. 'v3.105-1-7.212-7-9'.
+    """
+    return '.'.join([f"v{get_dataset_version()}"] + [f"{train}-{board}-{alight}" for train, board, alight in path])
+
+def decode_journey_id(journey_id):
+    """(dataset version, path) of a journey id; None if malformed"""
+    version, *legs = journey_id.split('.')
+    try:
+        if not version.startswith('v') or not legs:
+            return None
+        path = [tuple(int(part) for part in leg.split('-')) for leg in legs]
+        if any(len(leg) != 3 for leg in path):
+            return None
+        return int(version[1:]), path
+    except ValueError:
+        return None
 
-def find_direct_trains(from_station, to_station):
-    """Find direct trains between two stations"""
+def find_direct_trains(timetable, from_station, to_station, allowed_days=None, earliest=None, with_stops=True):
+    """
+    Find direct trains between two stations (journey dicts in integer minutes)
+    in ``timetable``, or the TripSegment index when it is None.
+    
+    ``allowed_days`` (operating-day codes, see parse_allowed_days) and
+    ``earliest`` (minutes, see departure_in_window) restrict the trains
+    considered; None means no restriction. With ``with_stops=False`` the
+    stop lists are left for attach_stops to fill in later.
+    """
+    if timetable is None:
+        return find_direct_trains_from_segments(from_station, to_station, allowed_days, earliest, with_stops)
+    
     results = []
     
-    # Optimized query: Get trains stopping at both stations with all their stops pre-fetched
-    # This reduces N+1 queries to just 2 queries total
-    trains = Train.objects.filter(
-        stops__station=from_station
-    ).filter(
-        stops__station=to_station
-    ).distinct().select_related('route').prefetch_related(
-        Prefetch('stops', queryset=Stop.objects.select_related('station').order_by('sequence'))
-    )
+    # All lookups run against the in-memory timetable snapshot (no SQL)
+    origin = timetable.station_index.get(from_station.id)
+    destination = timetable.station_index.get(to_station.id)
+    if origin is None or destination is None:
+        return results
+    
+    stop_station = timetable.stop_station
+    stop_time = timetable.stop_time
+    operating_days = timetable.train_operating_days
     
-    for train in trains:
-        # In-memory processing of pre-fetched stops
-        stops = list(train.stops.all())
+    # Only trains calling at the origin inside the departure window
+    since = earliest if earliest is not None and earliest > 0 else None
+    for train in timetable.trains_at(origin, since=since):
+        if allowed_days is not None and operating_days[train] not in allowed_days:
+            continue
         
-        # Find origin and dest stops
-        origin_stop = next((s for s in stops if s.station_id == from_station.id), None)
-        dest_stop = next((s for s in stops if s.station_id == to_station.id), None)
+        stops = timetable.train_stops(train)
         
-        if not origin_stop or not dest_stop:
+        # Find origin and dest stops (first occurrence of each station)
+        origin_stop = next((s for s in stops if stop_station[s] == origin), None)
+        dest_stop = next((s for s in stops if stop_station[s] == destination), None)
+        
+        if origin_stop is None or dest_stop is None:
             continue
-            
-        # Check sequence
-        if dest_stop.sequence <= origin_stop.sequence:
+        
+        # Check sequence (stops are laid out in sequence order)
+        if dest_stop <= origin_stop:
             continue
-            
-        # Skip if arrival time is before departure time (shuttle train showing return segment)
-        if dest_stop.departure_time < origin_stop.departure_time:
+        
+        # Skip untimed calls, and arrivals before departure (shuttle train showing return segment)
+        if stop_time[origin_stop] == NO_TIME or stop_time[dest_stop] < stop_time[origin_stop]:
             continue
-
+        
+        # The train may call at the origin again later; its first call must be in the window
+        if not departure_in_window(stop_time[origin_stop], earliest):
+            continue
+        
         # Get intermediate stops
-        intermediate_stops = [s for s in stops if origin_stop.sequence <= s.sequence <= dest_stop.sequence]
+        intermediate_stops = range(origin_stop, dest_stop + 1)
         
         # Check for duplicate stations (shuttle loop check)
-        station_ids = [s.station_id for s in intermediate_stops]
-        if station_ids.count(from_station.id) > 1 or station_ids.count(to_station.id) > 1:
+        station_ids = [stop_station[s] for s in intermediate_stops]
+        if station_ids.count(origin) > 1 or station_ids.count(destination) > 1:
             continue
-            
-        stops_list = [{
-            'station': stop.station.name_fr,
-            'station_ar': stop.station.name_ar,
-            'time': stop.departure_time.strftime('%H:%M') if stop.departure_time else '-'
-        } for stop in intermediate_stops]
         
         results.append({
-            'train_number': train.number,
-            'route_name': train.route.name,
-            'days_operational': train.days_operational,
-            'departure_time': origin_stop.departure_time.strftime('%H:%M') if origin_stop.departure_time else '-',
-            'arrival_time': dest_stop.departure_time.strftime('%H:%M') if dest_stop.departure_time else '-',
-            'duration': calculate_duration(origin_stop.departure_time, dest_stop.departure_time),
-            'stops': stops_list,
+            'train_id': timetable.train_ids[train],
+            'train_number': timetable.train_number[train],
+            'route_name': timetable.train_route_name[train],
+            'days_operational': timetable.train_days_operational[train],
+            'departure': stop_time[origin_stop],
+            'arrival': stop_time[dest_stop],
+            'span': (origin_stop, dest_stop),
+            'path': [(timetable.train_ids[train], from_station.id, to_station.id)],
+            'stops': None,
             'type': 'direct',
             'transfer': None
         })
     
+    if with_stops:
+        attach_stops(timetable, results)
     return results
 
-def find_connection_trains(from_station, to_station):
-    """Find trains with one connection (transfer)"""
-    unique_connections = {}
+def find_direct_trains_from_segments(from_station, to_station, allowed_days=None, earliest=None, with_stops=True):
+    """Find direct trains between two stations with one TripSegment index range scan"""
+    operating_days = None
+    if allowed_days is not None:
+        operating_days = [name for name, code in OPERATING_DAY_CODES.items() if code in allowed_days]
+    since = earliest if earliest is not None and earliest > 0 else None
+    segments = find_segments(
+        from_station.id, to_station.id, operating_days=operating_days, earliest=since
+    ).select_related('train__route')
     
-    # Optimized transfer station finding:
-    # 1. Get all trains passing through origin
-    origin_train_ids = Stop.objects.filter(station=from_station).values_list('train_id', flat=True)
+    results = [segment_journey(segment) for segment in segments]
     
-    # 2. Get all stations reachable by these trains
-    reachable_station_ids = set(Stop.objects.filter(train_id__in=origin_train_ids).values_list('station_id', flat=True))
+    if with_stops:
+        attach_stops(None, results)
+    return results
+
+def segment_journey(segment):
+    """Direct journey dict (without stop list) for a TripSegment with its train and route loaded"""
+    train = segment.train
+    return {
+        'train_id': train.id,
+        'train_number': train.number,
+        'route_name': train.route.name,
+        'days_operational': train.days_operational,
+        'departure': segment.departure_minutes,
+        'arrival': segment.arrival_minutes,
+        'span': (train.id, segment.origin_sequence, segment.destination_sequence),
+        'path': [(train.id, segment.origin_station_id, segment.destination_station_id)],
+        'stops': None,
+        'type': 'direct',
+        'transfer': None
+    }
+
+def attach_stops(timetable, journeys, compact=False):
+    """
+    Fill in the stop lists of journeys (and their legs) built without them.
     
-    # 3. Get all trains passing through destination
-    dest_train_ids = Stop.objects.filter(station=to_station).values_list('train_id', flat=True)
+    A pending stop list has ``'stops': None`` and a ``'span'``: stop indices
+    into ``timetable``, the snapshot the journeys were found in, or (train
+    id, first sequence, last sequence) when searching the TripSegment index
+    (``timetable`` None), where all spans load in one query.
+    Compact stop lists name stations by id.
+    """
+    pending = []
+    for journey in journeys:
+        for item in [journey] + journey.get('legs', []):
+            if item.get('stops') is None and 'span' in item:
+                pending.append(item)
+    if not pending:
+        return journeys
     
-    # 4. Get all stations that can reach destination (feeder stations)
-    feeder_station_ids = set(Stop.objects.filter(train_id__in=dest_train_ids).values_list('station_id', flat=True))
+    if timetable is not None:
+        for item in pending:
+            item['stops'] = build_stops_list(timetable, *item['span'], compact=compact)
+        return journeys
     
-    # 5. Intersection = Potential transfer stations
-    transfer_station_ids = reachable_station_ids & feeder_station_ids
+    stops_by_train = {}
+    stops = Stop.objects.filter(
+        train_id__in={item['span'][0] for item in pending}
+    ).order_by('train_id', 'sequence')
+    if not compact:
+        stops = stops.select_related('station')
+    for stop in stops:
+        stops_by_train.setdefault(stop.train_id, []).append(stop)
     
-    # Prioritize El Harrach and Birtouta
-    prioritized_transfers = []
-    other_transfers = []
+    for item in pending:
+        train_id, first_sequence, last_sequence = item['span']
+        item['stops'] = []
+        for stop in stops_by_train.get(train_id, []):
+            if not first_sequence <= stop.sequence <= last_sequence:
+                continue
+            time_str = stop.departure_time.strftime('%H:%M') if stop.departure_time else '-'
+            if compact:
+                item['stops'].append({'station': stop.station_id, 'time': time_str})
+            else:
+                item['stops'].append({
+                    'station': stop.station.name_fr,
+                    'station_ar': stop.station.name_ar,
+                    'time': time_str
+                })
+    return journeys
+
+def build_stops_list(timetable, first_stop, last_stop, compact=False):
+    """Serialize the stops of one train between two stop indices (inclusive)"""
+    if compact:
+        return [{
+            'station': timetable.station_ids[timetable.stop_station[stop]],
+            'time': format_minutes(timetable.stop_time[stop])
+        } for stop in range(first_stop, last_stop + 1)]
+    return [{
+        'station': timetable.station_name_fr[timetable.stop_station[stop]],
+        'station_ar': timetable.station_name_ar[timetable.stop_station[stop]],
+        'time': format_minutes(timetable.stop_time[stop])
+    } for stop in range(first_stop, last_stop + 1)]
+
+def snapshot_transfer_candidates(timetable, from_station, to_station):
+    """
+    Candidate transfer stations from the in-memory timetable, plus a loader
+    of each train's stop sequence (station id -> (first stop, last stop)).
+    """
+    origin = timetable.station_index.get(from_station.id)
+    destination = timetable.station_index.get(to_station.id)
+    if origin is None or destination is None:
+        return [], None
     
-    # Fetch station objects for the IDs
-    transfer_stations_map = {s.id: s for s in Station.objects.filter(id__in=transfer_station_ids)}
+    stop_station = timetable.stop_station
     
-    for sid in transfer_station_ids:
-        if sid == from_station.id or sid == to_station.id:
-            continue
-            
-        station = transfer_stations_map.get(sid)
-        if not station: continue
+    if timetable.transfers:
+        # Transfer stations precomputed at import time, shortest wait first
+        transfer_stations = [
+            timetable.station(timetable.station_ids[transfer])
+            for transfer, _ in timetable.transfers.get((origin, destination), [])
+        ]
+    else:
+        # Connection table not built yet: stations both reachable from the
+        # origin and feeding the destination
+        reachable_station_ids = set()
+        for train in timetable.trains_at(origin):
+            reachable_station_ids.update(stop_station[s] for s in timetable.train_stops(train))
         
-        if station.name_fr in ['El Harrach', 'Birtouta']:
-            prioritized_transfers.append(sid)
-        else:
-            other_transfers.append(sid)
-            
-    ordered_transfer_stations = prioritized_transfers + other_transfers
+        feeder_station_ids = set()
+        for train in timetable.trains_at(destination):
+            feeder_station_ids.update(stop_station[s] for s in timetable.train_stops(train))
+        
+        transfer_stations = [
+            timetable.station(timetable.station_ids[sid])
+            for sid in reachable_station_ids & feeder_station_ids
+            if sid != origin and sid != destination
+        ]
+    
+    positions_by_train = {}
+    
+    def load_positions(train_ids):
+        for train_id in train_ids:
+            if train_id in positions_by_train:
+                continue
+            positions = {}
+            for stop in timetable.train_stops(timetable.train_index[train_id]):
+                station_id = timetable.station_ids[stop_station[stop]]
+                positions[station_id] = (positions.get(station_id, (stop, stop))[0], stop)
+            positions_by_train[train_id] = positions
+        return positions_by_train
+    
+    return transfer_stations, load_positions
+
+def find_connection_trains(timetable, from_station, to_station, allowed_days=None, earliest=None):
+    """
+    Find trains with one connection (transfer), as journey dicts in integer minutes.
+    
+    Both legs must run on ``allowed_days``; the first leg must leave inside
+    the window starting at ``earliest`` (see find_direct_trains).
+    """
+    return attach_stops(timetable, list(iter_connection_trains(timetable, from_station, to_station, allowed_days, earliest)))
+
+def iter_connection_trains(timetable, from_station, to_station, allowed_days=None, earliest=None, keep=None,
+                           load_positions=None):
+    """Yield one-transfer journeys as they are found, without stop lists (see iter_connection_groups)"""
+    for journeys in iter_connection_groups(timetable, from_station, to_station, allowed_days, earliest, keep,
+                                           load_positions):
+        yield from journeys
+
+def stations_between(train_positions, start_station_id, end_station_id):
+    """Stations a train calls at strictly between two of its stations (positions as from load_positions)"""
+    start = train_positions[start_station_id][0]
+    end = train_positions[end_station_id][1]
+    return {
+        station_id for station_id, (first, last) in train_positions.items()
+        if start < first < end or start < last < end
+    } - {start_station_id, end_station_id}
+
+def iter_connection_groups(timetable, from_station, to_station, allowed_days=None, earliest=None, keep=None,
+                           load_positions=None):
+    """
+    Yield the one-transfer journeys through each transfer station of
+    ``timetable`` (the TripSegment index when None), as a list per station
+    (stations with none are skipped), without stop lists.
+    
+    ``keep(departure, arrival)`` optionally rejects candidates early: it is
+    asked first with a lower bound of the arrival for each first leg, then
+    with the exact times of each pair, before anything is built.
+    ``load_positions`` replaces the per-search loader of train stop
+    sequences, e.g. one shared by a batch of searches. Searching the
+    TripSegment index, the legs and stop sequences of all transfer stations
+    are loaded up front in a fixed number of queries.
+    """
+    seen_pairs = set()
+    min_transfer = get_min_transfer_minutes()
+    
+    # Candidate transfer stations (from the Connection table when built), from
+    # the in-memory timetable or from the database
+    if timetable is not None:
+        transfer_stations, own_loader = snapshot_transfer_candidates(timetable, from_station, to_station)
+    else:
+        transfer_stations, own_loader = segment_transfer_candidates(from_station, to_station)
+    if load_positions is None:
+        load_positions = own_loader
+    
+    def legs_via(transfer_station):
+        return connection_legs(timetable, from_station, to_station, transfer_station, allowed_days, earliest)
+    
+    if timetable is None:
+        legs_by_station = segment_connection_legs(from_station, to_station, transfer_stations, allowed_days, earliest)
+        load_positions([leg['train_id'] for first_legs, second_legs in legs_by_station for leg in first_legs + second_legs])
+    else:
+        legs_by_station = map(legs_via, transfer_stations)
     
     # For each potential transfer station, find valid connections
-    for transfer_station_id in ordered_transfer_stations:
-        transfer_station = Station.objects.get(id=transfer_station_id)
+    for transfer_station, (first_leg_trains, second_leg_trains) in zip(transfer_stations, legs_by_station):
+        if not first_leg_trains:
+            continue
+        
+        # Stop sequence of each involved train, loaded once per request and
+        # keyed by train id: station id -> (first position, last position)
+        positions = load_positions([leg['train_id'] for leg in first_leg_trains + second_leg_trains])
+        
+        # ANTI-BACKTRACKING CHECKS (once per leg, not once per pair):
+        # Skip first legs whose train also passes through the destination
+        # (the user should just stay on the train)
+        first_leg_trains = [
+            leg for leg in first_leg_trains
+            if to_station.id not in positions[leg['train_id']]
+        ]
+        # ... and those that can't make the results even with the quickest change
+        if keep is not None:
+            first_leg_trains = [
+                leg for leg in first_leg_trains
+                if keep(leg['departure'], leg['arrival'] + min_transfer)
+            ]
         
-        # Find first leg: from_station → transfer_station
-        first_leg_trains = find_direct_trains(from_station, transfer_station)
+        # Skip second legs whose train goes transfer → origin → destination
+        # (the user should wait at the origin for that train instead)
+        valid_second_legs = []
+        for leg in second_leg_trains:
+            train_positions = positions[leg['train_id']]
+            if from_station.id in train_positions and train_positions[transfer_station.id][1] < train_positions[from_station.id][1]:
+                continue
+            valid_second_legs.append(leg)
+        second_leg_trains = valid_second_legs
         
-        # Find second leg: transfer_station → to_station
-        second_leg_trains = find_direct_trains(transfer_station, to_station)
+        # Stations each first train calls at between the origin and this
+        # station, and each second train between here and the destination. A
+        # pair sharing one doubles back: changing there is the same journey
+        passed_before = {
+            leg['train_id']: stations_between(positions[leg['train_id']], from_station.id, transfer_station.id)
+            for leg in first_leg_trains
+        }
+        passed_after = {
+            leg['train_id']: stations_between(positions[leg['train_id']], transfer_station.id, to_station.id)
+            for leg in second_leg_trains
+        }
         
         # Match compatible connections (with reasonable transfer time)
+        connections = []
         for first_leg in first_leg_trains:
             for second_leg in second_leg_trains:
-                # ANTI-BACKTRACKING CHECK:
-                # Verify that the second leg train doesn't pass through the origin station
-                # before reaching the transfer station (which would mean we're going backward)
-                # Also verify first leg doesn't pass through destination after transfer
+                # Check if there's enough time to transfer (at least 10 minutes),
+                # the second train possibly leaving after midnight
+                transfer_time = (second_leg['departure'] - first_leg['arrival']) % MINUTES_PER_DAY
                 
-                # Get the actual train objects to check their full route
-                try:
-                    second_train = Train.objects.filter(number=second_leg['train_number']).first()
-                    if not second_train:
+                if min_transfer <= transfer_time <= MAX_TRANSFER_MINUTES:  # 10 min (default) to 3 hours
+                    if not passed_before[first_leg['train_id']].isdisjoint(passed_after[second_leg['train_id']]):
                         continue
-                        
-                    second_train_stops = Stop.objects.filter(train=second_train).select_related('station').order_by('sequence')
                     
-                    # Check if origin station appears in second leg before transfer station
-                    origin_in_second_leg = None
-                    transfer_in_second_leg = None
-                    
-                    for stop in second_train_stops:
-                        if stop.station.id == from_station.id:
-                            origin_in_second_leg = stop.sequence
-                        if stop.station.id == transfer_station.id:
-                            transfer_in_second_leg = stop.sequence
-                    
-                    # If origin appears AFTER transfer in second leg, skip (backtracking)
-                    # This means the train goes: transfer → origin → destination
-                    if origin_in_second_leg and transfer_in_second_leg and transfer_in_second_leg < origin_in_second_leg:
-                        continue  # Skip this connection - user should wait at origin for second train
-                    
-                    # Similarly check first leg doesn't go past destination after transfer
-                    first_train = Train.objects.filter(number=first_leg['train_number']).first()
-                    if not first_train:
+                    # A train pair takes the same time whichever station the
+                    # change is made at, so the first one found is kept
+                    pair_key = (first_leg['train_id'], second_leg['train_id'])
+                    if pair_key in seen_pairs:
                         continue
-                        
-                    first_train_stops = Stop.objects.filter(train=first_train).select_related('station').order_by('sequence')
-                    
-                    transfer_in_first_leg = None
-                    dest_in_first_leg = None
-                    
-                    for stop in first_train_stops:
-                        # Only record FIRST occurrence of each station
-                        if stop.station.id == transfer_station.id and transfer_in_first_leg is None:
-                            transfer_in_first_leg = stop.sequence
-                        if stop.station.id == to_station.id and dest_in_first_leg is None:
-                            dest_in_first_leg = stop.sequence
-                    
-                    # If destination appears in first leg (before OR after transfer), skip
-                    # This means train goes through destination, so user should just stay on the train
-                    if dest_in_first_leg and transfer_in_first_leg:
-                        continue  # Skip this connection
-                        
-                except Exception:
-                    pass  # If train not found, continue with connection (shouldn't happen)
-                
-                # Check if there's enough time to transfer (at least 10 minutes)
-                arrival_time = datetime.strptime(first_leg['arrival_time'], '%H:%M')
-                departure_time = datetime.strptime(second_leg['departure_time'], '%H:%M')
-                
-                # Handle next-day departures
-                if departure_time < arrival_time:
-                    departure_time += timedelta(days=1)
-                
-                transfer_time = (departure_time - arrival_time).seconds // 60
-                
-                if 10 <= transfer_time <= 180:  # 10 min to 3 hours
-                    # Calculate total duration in minutes
-                    dep_origin = datetime.strptime(first_leg['departure_time'], '%H:%M')
-                    arr_dest = datetime.strptime(second_leg['arrival_time'], '%H:%M')
-                    
-                    if arr_dest < dep_origin:
-                        arr_dest += timedelta(days=1)
+                    seen_pairs.add(pair_key)
                     
-                    total_minutes = (arr_dest - dep_origin).seconds // 60
-                        
-                    pair_key = (first_leg['train_number'], second_leg['train_number'])
+                    second_departure = first_leg['arrival'] + transfer_time
+                    arrival = second_departure + second_leg['arrival'] - second_leg['departure']
+                    if keep is not None and not keep(first_leg['departure'], arrival):
+                        continue
                     
-                    result = {
+                    connections.append({
                         'train_number': f"{first_leg['train_number']} + {second_leg['train_number']}",
                         'route_name': f"{first_leg['route_name']} / {second_leg['route_name']}",
                         'days_operational': first_leg['days_operational'],
-                        'departure_time': first_leg['departure_time'],
-                        'arrival_time': second_leg['arrival_time'],
-                        'duration': calculate_total_duration(
-                            first_leg['departure_time'],
-                            second_leg['arrival_time']
-                        ),
+                        'departure': first_leg['departure'],
+                        'arrival': arrival,
                         'type': 'connection',
+                        'path': [
+                            (first_leg['train_id'], from_station.id, transfer_station.id),
+                            (second_leg['train_id'], transfer_station.id, to_station.id)
+                        ],
                         'transfer': {
                             'station': transfer_station.name_fr,
                             'station_ar': transfer_station.name_ar,
-                            'arrival': first_leg['arrival_time'],
-                            'departure': second_leg['departure_time'],
-                            'wait_time': f"{transfer_time} min"
+                            'arrival': first_leg['arrival'],
+                            'departure': second_departure,
+                            'wait': transfer_time
                         },
                         'legs': [
                             {
                                 'train': first_leg['train_number'],
                                 'from': from_station.name_fr,
                                 'to': transfer_station.name_fr,
-                                'departure': first_leg['departure_time'],
-                                'arrival': first_leg['arrival_time'],
-                                'stops': first_leg['stops']
+                                'departure': first_leg['departure'],
+                                'arrival': first_leg['arrival'],
+                                'span': first_leg['span'],
+                                'stops': None
                             },
                             {
                                 'train': second_leg['train_number'],
                                 'from': transfer_station.name_fr,
                                 'to': to_station.name_fr,
-                                'departure': second_leg['departure_time'],
-                                'arrival': second_leg['arrival_time'],
-                                'stops': second_leg['stops']
+                                'departure': second_departure,
+                                'arrival': arrival,
+                                'span': second_leg['span'],
+                                'stops': None
                             }
-                        ],
-                        'total_minutes': total_minutes # Internal use for comparison
-                    }
-                    
-                    # If this pair is new, or if this transfer option is faster, keep it
-                    if pair_key not in unique_connections or total_minutes < unique_connections[pair_key]['total_minutes']:
-                        unique_connections[pair_key] = result
-
-    # Convert dictionary values to list
-    results = list(unique_connections.values())
-    
-    # Remove internal sorting key before returning if desired, though extra keys are harmless in JSON response usually.
-    # But let's keep it clean.
-    for r in results:
-        if 'total_minutes' in r:
-            del r['total_minutes']
-            
-    return results
+                        ]
+                    })
+        if connections:
+            yield connections
 
-def calculate_duration(start_time, end_time):
-    """Calculate duration between two times"""
-    if not start_time or not end_time:
-        return 'N/A'
+def connection_legs(timetable, from_station, to_station, transfer_station, allowed_days=None, earliest=None):
+    """
+    First legs (origin → transfer station) and second legs (transfer station
+    → destination) of the connections through one station, without stop lists.
+    """
+    # Find first leg: from_station → transfer_station
+    first_leg_trains = find_direct_trains(timetable, from_station, transfer_station, allowed_days, earliest, with_stops=False)
+    if not first_leg_trains:
+        return [], []
     
-    # Convert to datetime for calculation
-    start = datetime.combine(datetime.today(), start_time)
-    end = datetime.combine(datetime.today(), end_time)
+    # Find second leg: transfer_station → to_station, leaving no earlier
+    # than the first possible change (unless the wait can run past midnight)
+    second_earliest = min(leg['arrival'] for leg in first_leg_trains) + get_min_transfer_minutes()
+    if max(leg['arrival'] for leg in first_leg_trains) + MAX_TRANSFER_MINUTES >= MINUTES_PER_DAY:
+        second_earliest = None
+    second_leg_trains = find_direct_trains(timetable, transfer_station, to_station, allowed_days, second_earliest, with_stops=False)
+    return first_leg_trains, second_leg_trains
+
+def segment_connection_legs(from_station, to_station, transfer_stations, allowed_days=None, earliest=None):
+    """
+    connection_legs for every transfer station from two TripSegment queries
+    (all first legs, then all second legs) instead of two per station.
+    """
+    operating_days = None
+    if allowed_days is not None:
+        operating_days = [name for name, code in OPERATING_DAY_CODES.items() if code in allowed_days]
     
-    # Handle next-day arrivals
-    if end < start:
-        end += timedelta(days=1)
+    def segments(**lookups):
+        found = TripSegment.objects.filter(**lookups)
+        if operating_days is not None:
+            found = found.filter(operating_days__in=operating_days)
+        return found.select_related('train__route').order_by('departure_minutes', 'id')
     
-    duration = end - start
-    hours = duration.seconds // 3600
-    minutes = (duration.seconds % 3600) // 60
+    first_legs = {station.id: [] for station in transfer_stations}
+    since = earliest if earliest is not None and earliest > 0 else None
+    first_segments = segments(origin_station_id=from_station.id, destination_station_id__in=list(first_legs))
+    if since is not None:
+        first_segments = first_segments.filter(departure_minutes__gte=since)
+    for segment in first_segments:
+        first_legs[segment.destination_station_id].append(segment_journey(segment))
     
-    return f"{hours}h{minutes:02d}" if hours > 0 else f"{minutes}min"
+    # Earliest second leg departure per transfer station, as in connection_legs
+    second_earliest = {}
+    for station_id, legs in first_legs.items():
+        if not legs:
+            continue
+        second_earliest[station_id] = min(leg['arrival'] for leg in legs) + get_min_transfer_minutes()
+        if max(leg['arrival'] for leg in legs) + MAX_TRANSFER_MINUTES >= MINUTES_PER_DAY:
+            second_earliest[station_id] = None
+    
+    second_legs = {station_id: [] for station_id in second_earliest}
+    if second_legs:
+        second_segments = segments(origin_station_id__in=list(second_legs), destination_station_id=to_station.id)
+        bounds = list(second_earliest.values())
+        if None not in bounds and min(bounds) > 0:
+            second_segments = second_segments.filter(departure_minutes__gte=min(bounds))
+        for segment in second_segments:
+            bound = second_earliest[segment.origin_station_id]
+            if bound is None or bound <= 0 or segment.departure_minutes >= bound:
+                second_legs[segment.origin_station_id].append(segment_journey(segment))
+    
+    return [
+        (first_legs[station.id], second_legs[station.id]) if station.id in second_legs else ([], [])
+        for station in transfer_stations
+    ]
 
-def calculate_total_duration(dep_time_str, arr_time_str):
-    """Calculate total duration from string times"""
+def parse_allowed_days(day_of_week):
+    """Operating-day codes valid on a day of week (0=Sunday ... 5=Friday), None for any day"""
     try:
-        dep = datetime.strptime(dep_time_str, '%H:%M')
-        arr = datetime.strptime(arr_time_str, '%H:%M')
-        
-        if arr < dep:
-            arr += timedelta(days=1)
-        
-        duration = arr - dep
-        hours = duration.seconds // 3600
-        minutes = (duration.seconds % 3600) // 60
+        if int(day_of_week) == 5:
+            return {OPERATING_DAY_CODES['daily'], OPERATING_DAY_CODES['friday_only']}
+        return {OPERATING_DAY_CODES['daily'], OPERATING_DAY_CODES['no_friday']}
+    except (TypeError, ValueError):
+        return None
+
+def parse_departure_minutes(departure_time_str, look_back=0):
+    """Minutes since midnight for an HH:MM string, minus an optional look-back (0 if missing)"""
+    minutes = parse_minutes(departure_time_str)
+    if minutes is None:
+        return 0
+    return max(0, minutes - look_back)
+
+def build_journey(timetable, legs, compact=False, with_stops=True):
+    """
+    Journey dict (integer minutes) for legs of (train, board stop, alight stop) indices.
+    
+    A single leg gives a 'direct' result, several legs a 'connection' result
+    with every change listed under 'transfers'. Stop lists are compact (see
+    build_stops_list) or, without ``with_stops``, left out.
+    """
+    def stops_list(board, alight):
+        return build_stops_list(timetable, board, alight, compact) if with_stops else None
+    
+    stop_time = timetable.stop_time
+    stop_station = timetable.stop_station
+    trains = [train for train, _, _ in legs]
+    
+    # Times with their day offset: each one at or after the one before it
+    times = []
+    for _, board, alight in legs:
+        departure = arrival_after(times[-1][1], stop_time[board]) if times else stop_time[board]
+        times.append((departure, arrival_after(departure, stop_time[alight])))
+    
+    result = {
+        'train_number': ' + '.join(timetable.train_number[t] for t in trains),
+        'route_name': ' / '.join(timetable.train_route_name[t] for t in trains),
+        'days_operational': timetable.train_days_operational[trains[0]],
+        'departure': times[0][0],
+        'arrival': times[-1][1],
+        'path': [(
+            timetable.train_ids[train],
+            timetable.station_ids[stop_station[board]],
+            timetable.station_ids[stop_station[alight]]
+        ) for train, board, alight in legs],
+    }
+    
+    if len(legs) == 1:
+        train, board, alight = legs[0]
+        result.update({
+            'train_id': timetable.train_ids[train],
+            'stops': stops_list(board, alight),
+            'type': 'direct',
+            'transfer': None
+        })
+        return result
+    
+    transfers = []
+    for (_, _, alight), (_, arrival), (departure, _) in zip(legs, times, times[1:]):
+        station = stop_station[alight]
+        transfers.append({
+            'station': timetable.station_name_fr[station],
+            'station_ar': timetable.station_name_ar[station],
+            'arrival': arrival,
+            'departure': departure,
+            'wait': departure - arrival
+        })
+    
+    result.update({
+        'type': 'connection',
+        'transfer': transfers[0],
+        'transfers': transfers,
+        'legs': [{
+            'train': timetable.train_number[train],
+            'from': timetable.station_name_fr[stop_station[board]],
+            'to': timetable.station_name_fr[stop_station[alight]],
+            'departure': departure,
+            'arrival': arrival,
+            'stops': stops_list(board, alight)
+        } for (train, board, alight), (departure, arrival) in zip(legs, times)]
+    })
+    return result
+
+def find_multi_connection_trains(timetable, from_station, to_station, departure_time_str=None, day_of_week=None,
+                                 count=10, compact=False, with_stops=True):
+    """Find journeys with any number of transfers in a timetable snapshot using the Connection Scan Algorithm"""
+    origin = timetable.station_index.get(from_station.id)
+    destination = timetable.station_index.get(to_station.id)
+    if origin is None or destination is None or origin == destination:
+        return []
+    
+    # Same 60 minute look-back as the departure time filter
+    departure = parse_departure_minutes(departure_time_str, look_back=DEPARTURE_LOOK_BACK)
+    
+    scan = get_connection_scan(timetable)
+    results = []
+    for journey in scan.journeys(origin, destination, departure, count, allowed_days=parse_allowed_days(day_of_week)):
+        # Single-train journeys are left to find_direct_trains and its shuttle checks
+        if len(journey) < 2:
+            continue
+        legs = [
+            (timetable.stop_train[scan.dep_stop[boarding]], scan.dep_stop[boarding], scan.arr_stop[alighting])
+            for boarding, alighting in journey
+        ]
+        results.append(build_journey(timetable, legs, compact, with_stops))
+    
+    return results
+
+def find_pareto_journeys(timetable, from_station, to_station, departure_time_str=None, day_of_week=None,
+                         max_transfers=DEFAULT_MAX_TRANSFERS, compact=False, with_stops=True):
+    """
+    Pareto set of journeys (earliest arrival for 0, 1, 2, ... transfers) in
+    a timetable snapshot using RAPTOR.
+    
+    Results are ordered by number of transfers; each one arrives strictly
+    earlier than the one before it.
+    """
+    origin = timetable.station_index.get(from_station.id)
+    destination = timetable.station_index.get(to_station.id)
+    if origin is None or destination is None:
+        return []
+    
+    journeys = get_raptor(timetable).pareto(
+        origin, destination, parse_departure_minutes(departure_time_str),
+        max_transfers=max_transfers, allowed_days=parse_allowed_days(day_of_week)
+    )
+    results = []
+    for legs in journeys:
+        result = build_journey(timetable, legs, compact, with_stops)
+        result['transfers_count'] = len(legs) - 1
+        results.append(result)
+    return results
+
+@api_view(['GET'])
+@dataset_condition(now=('time', 'day'))
+def reachability(request):
+    """
+    Earliest arrival at every station reachable from an origin within a time budget.
+    
+    Query parameters:
+    - from: Origin station ID
+    - time: Departure time (HH:MM format, default now)
+    - day: Day of week (0=Sunday, 1=Monday, ..., 6=Saturday, default today)
+    - max_minutes: Travel time budget in minutes (default 120, at most 1440)
+    
+    Computed with a single Connection Scan from the origin; stations are
+    returned nearest first with their coordinates for the map overlay.
+    Needs the timetable snapshot: 501 with TIMETABLE_SNAPSHOT = False.
+    """
+    day_of_week = request.GET.get('day', '')
+    
+    # 1. Validate parameters
+    if not request.GET.get('from'):
+        return Response({'error': 'Origin station ID (from) is required'}, status=400)
+    timetable = current_timetable()
+    if timetable is None:
+        return Response({'error': 'Reachability needs the timetable snapshot (TIMETABLE_SNAPSHOT)'}, status=501)
+    origin_station = resolve_station(timetable, request.GET.get('from'))
+    if origin_station is None:
+        return Response({'error': 'Invalid station ID'}, status=404)
+    
+    departure = parse_minutes(request.GET.get('time') or datetime.now().strftime('%H:%M'))
+    if departure is None:
+        return Response({'error': 'time must be HH:MM'}, status=400)
+    
+    try:
+        max_minutes = int(request.GET.get('max_minutes', DEFAULT_REACHABILITY_MINUTES))
+    except ValueError:
+        return Response({'error': 'max_minutes must be an integer'}, status=400)
+    max_minutes = min(max(max_minutes, 0), MINUTES_PER_DAY)
+    
+    if not day_of_week:
+        day_of_week = day_number(datetime.now())
+    
+    # 2. One earliest-arrival scan to every station
+    origin = timetable.station_index.get(origin_station.id)
+    if origin is None:
+        return Response({'error': 'Station not in the published timetable'}, status=404)
+    max_arrival = departure + max_minutes
+    arrival, transfers, _ = get_connection_scan(timetable).scan(
+        origin, departure, allowed_days=parse_allowed_days(day_of_week), max_arrival=max_arrival
+    )
+    
+    # 3. Stations reached within the budget, nearest first
+    reached = sorted(
+        (arrival[station] - departure, station)
+        for station in range(len(timetable.station_ids))
+        if arrival[station] <= max_arrival
+    )
+    stations = [{
+        'id': timetable.station_ids[station],
+        'name': timetable.station_name_fr[station],
+        'name_ar': timetable.station_name_ar[station],
+        'latitude': timetable.station_latitude[station],
+        'longitude': timetable.station_longitude[station],
+        'arrival_time': format_minutes(arrival[station]),
+        'minutes': minutes,
+        'transfers': transfers[station]
+    } for minutes, station in reached]
+    
+    return Response({
+        'from': {
+            'id': origin_station.id,
+            'name': origin_station.name_fr,
+            'name_ar': origin_station.name_ar
+        },
+        'departure_time': format_minutes(departure),
+        'max_minutes': max_minutes,
+        'stations': stations
+    })
+
+def find_departures(timetable, station, since, allowed_days=None, limit=DEFAULT_DEPARTURES):
+    """
+    Next ``limit`` departures from a station at or after ``since`` (minutes)
+    in ``timetable`` (the database when None), skipping terminating trains;
+    past the day's last train the board wraps around to the first ones
+    after midnight.
+    """
+    if timetable is None:
+        return find_departures_from_database(station, since, allowed_days, limit)
+    
+    origin = timetable.station_index.get(station.id)
+    if origin is None:
+        return []
+    
+    stop_time = timetable.stop_time
+    stop_train = timetable.stop_train
+    stop_station = timetable.stop_station
+    operating_days = timetable.train_operating_days
+    
+    # Calls at the station are pre-sorted by time: binary search the first one,
+    # then wrap around from the first timed call (after midnight)
+    departures = timetable.station_departures[origin]
+    start = bisect_left(departures, since, key=stop_time.__getitem__)
+    first_timed = bisect_left(departures, 0, key=stop_time.__getitem__)
+    results = []
+    for position in chain(range(start, len(departures)), range(first_timed, start)):
+        stop = departures[position]
+        train = stop_train[stop]
+        if allowed_days is not None and operating_days[train] not in allowed_days:
+            continue
+        last_stop = timetable.train_first_stop[train + 1] - 1
+        if stop == last_stop:
+            continue
         
-        return f"{hours}h{minutes:02d}" if hours > 0 else f"{minutes}min"
-    except:
-        return 'N/A'
+        results.append({
+            'train_id': timetable.train_ids[train],
+            'train_number': timetable.train_number[train],
+            'route_name': timetable.train_route_name[train],
+            'days_operational': timetable.train_days_operational[train],
+            'departure_time': format_minutes(stop_time[stop]),
+            'destination': timetable.station_name_fr[stop_station[last_stop]],
+            'destination_ar': timetable.station_name_ar[stop_station[last_stop]],
+            'next_stops': build_stops_list(timetable, stop + 1, min(stop + NEXT_STOPS, last_stop))
+        })
+        if len(results) >= limit:
+            break
+    
+    return results
+
+def find_departures_from_database(station, since, allowed_days=None, limit=DEFAULT_DEPARTURES):
+    """Departure board from the Stop(station, departure_time) index (2 queries, 3 when it wraps past midnight)"""
+    candidates = Stop.objects.filter(station_id=station.id).filter(
+        # Not the train's final stop
+        Exists(Stop.objects.filter(train_id=OuterRef('train_id'), sequence__gt=OuterRef('sequence')))
+    )
+    if allowed_days is not None:
+        candidates = candidates.filter(train__operating_days__in=[
+            name for name, code in OPERATING_DAY_CODES.items() if code in allowed_days
+        ])
+    candidates = candidates.select_related('train__route').order_by('departure_time', 'id')
+    since_time = time(since // 60, since % 60)
+    stops = list(candidates.filter(departure_time__gte=since_time)[:limit])
+    if len(stops) < limit:
+        stops += candidates.filter(departure_time__lt=since_time)[:limit - len(stops)]
+    
+    # Rest of the journey of each train, in one query
+    calls_by_train = {}
+    for call in Stop.objects.filter(
+        train_id__in={stop.train_id for stop in stops}
+    ).select_related('station').order_by('train_id', 'sequence'):
+        calls_by_train.setdefault(call.train_id, []).append(call)
+    
+    results = []
+    for stop in stops:
+        calls = calls_by_train.get(stop.train_id, [])
+        next_calls = [call for call in calls if call.sequence > stop.sequence]
+        results.append({
+            'train_id': stop.train_id,
+            'train_number': stop.train.number,
+            'route_name': stop.train.route.name,
+            'days_operational': stop.train.days_operational,
+            'departure_time': stop.departure_time.strftime('%H:%M'),
+            'destination': calls[-1].station.name_fr,
+            'destination_ar': calls[-1].station.name_ar,
+            'next_stops': [{
+                'station': call.station.name_fr,
+                'station_ar': call.station.name_ar,
+                'time': call.departure_time.strftime('%H:%M') if call.departure_time else '-'
+            } for call in next_calls[:NEXT_STOPS]]
+        })
+    
+    return results
+
+@api_view(['GET'])
+def timetable_bundle(request):
+    """
+    Manifest of the precompiled timetable bundle (api.bundle).
+    
+    Clients compare 'version' with the bundle they hold and download 'url'
+    when it changed; the bundle itself is a static, immutable file.
+    """
+    manifest = read_manifest()
+    if manifest is None:
+        return Response({'error': 'Timetable bundle has not been built'}, status=404)
+    
+    response = Response(manifest)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@require_safe
+def timetable_bundle_file(request, name):
+    """
+    One timetable bundle (the manifest's 'url'), compressed when the client
+    accepts it. Read from TIMETABLE_BUNDLE_ROOT on every request, so bundles
+    written by an import are served without a restart.
+    """
+    accepted = {token.split(';')[0].strip() for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+    opened = open_bundle(name, accepted)
+    if opened is None:
+        raise Http404('Unknown timetable bundle')
+    
+    bundle, encoding = opened
+    response = FileResponse(bundle, content_type='application/json')
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    # Names carry a content hash: a bundle never changes
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+@api_view(['GET'])
+@dataset_condition()
+def timetable_changes(request):
+    """
+    Delta sync: what changed in the timetable since a dataset version.
+    
+    Query parameters:
+    - since: Dataset version the client holds (the 'version' of its bundle or last sync)
+    
+    Returns the added/modified records and removed keys of stations and
+    trains, or 'full_resync': true with the current bundle URL when the
+    change log no longer covers 'since'.
+    """
+    # 1. Validate parameters
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        return Response({'error': 'since must be a dataset version number'}, status=400)
+    if since < 0:
+        return Response({'error': 'since must be a dataset version number'}, status=400)
+    
+    # 2. Net changes, or tell the client to download the whole bundle again
+    changes = get_changes(since)
+    if changes['full_resync']:
+        manifest = read_manifest()
+        changes['bundle'] = manifest['url'] if manifest else None
+    return Response(changes)
+
+def metrics(request):
+    """
+    Prometheus metrics in the text exposition format (api.metrics): request
+    latency and query counts per endpoint, search outcomes, cache hits and
+    the current dataset version
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
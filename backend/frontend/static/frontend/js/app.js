@@ -15,7 +15,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const destSuggestions = document.getElementById('destination-suggestions');
 
     let currentLang = 'fr';
-    let stations = [];
+    // Stations picked from suggestions, by id (to rename them on language change)
+    const selectedStations = {};
 
     const translations = {
         fr: {
@@ -82,15 +83,6 @@ document.addEventListener('DOMContentLoaded', () => {
         })
         .catch(err => console.error('Error fetching lines:', err));
 
-    // Fetch Stations
-    fetch('/api/stations/')
-        .then(res => res.json())
-        .then(data => {
-            stations = data;
-            // No more populateSelects(), just ready for autocomplete
-        })
-        .catch(err => console.error('Error fetching stations:', err));
-
     // Custom Time Input Logic
     const timeHours = document.getElementById('time-hours');
     const timeMinutes = document.getElementById('time-minutes');
@@ -190,37 +182,43 @@ document.addEventListener('DOMContentLoaded', () => {
     // Autocomplete Setup
     function setupAutocomplete(input, hiddenInput, suggestionsDiv) {
         input.addEventListener('input', debounce((e) => {
-            const query = e.target.value.toLowerCase();
-            suggestionsDiv.innerHTML = '';
+            const query = e.target.value.trim();
 
             if (query.length < 1) {
+                suggestionsDiv.innerHTML = '';
                 suggestionsDiv.classList.add('hidden');
                 return;
             }
 
-            const filtered = stations.filter(s =>
-                s.name_fr.toLowerCase().includes(query) ||
-                s.name_ar.toLowerCase().includes(query)
-            );
-
-            if (filtered.length > 0) {
-                filtered.forEach(station => {
-                    const div = document.createElement('div');
-                    div.className = 'suggestion-item';
-                    const name = currentLang === 'fr' ? station.name_fr : station.name_ar;
-                    div.textContent = name;
-                    div.addEventListener('click', () => {
-                        input.value = name;
-                        hiddenInput.value = station.id;
+            // Matching (accents, aliases, typos) is done by the server-side index
+            fetch(`/api/stations/suggest/?q=${encodeURIComponent(query)}`)
+                .then(res => res.json())
+                .then(suggestions => {
+                    // Ignore answers for text the user has since changed
+                    if (input.value.trim() !== query) return;
+                    suggestionsDiv.innerHTML = '';
+
+                    if (suggestions.length > 0) {
+                        suggestions.forEach(station => {
+                            const div = document.createElement('div');
+                            div.className = 'suggestion-item';
+                            const name = currentLang === 'fr' ? station.name_fr : station.name_ar;
+                            div.textContent = name;
+                            div.addEventListener('click', () => {
+                                input.value = name;
+                                hiddenInput.value = station.id;
+                                selectedStations[station.id] = station;
+                                suggestionsDiv.classList.add('hidden');
+                                suggestionsDiv.innerHTML = '';
+                            });
+                            suggestionsDiv.appendChild(div);
+                        });
+                        suggestionsDiv.classList.remove('hidden');
+                    } else {
                         suggestionsDiv.classList.add('hidden');
-                        suggestionsDiv.innerHTML = '';
-                    });
-                    suggestionsDiv.appendChild(div);
-                });
-                suggestionsDiv.classList.remove('hidden');
-            } else {
-                suggestionsDiv.classList.add('hidden');
-            }
+                    }
+                })
+                .catch(err => console.error('Error fetching station suggestions:', err));
         }, 300));
 
         // Hide suggestions when clicking outside
@@ -274,11 +272,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Update input values if ID is selected (refresh name in new lang)
         if (originHidden.value) {
-            const s = stations.find(st => st.id == originHidden.value);
+            const s = selectedStations[originHidden.value];
             if (s) originInput.value = lang === 'fr' ? s.name_fr : s.name_ar;
         }
         if (destHidden.value) {
-            const s = stations.find(st => st.id == destHidden.value);
+            const s = selectedStations[destHidden.value];
             if (s) destInput.value = lang === 'fr' ? s.name_fr : s.name_ar;
         }
     }
@@ -1,4 +1,7 @@
 const CACHE_NAME = 'sntf-cache-v1';
+const BUNDLE_CACHE = 'sntf-timetable-bundle';
+const BUNDLE_MANIFEST = '/api/timetable/bundle/';
+const BUNDLE_FILES = '/api/timetable/bundles/';
 const ASSETS_TO_CACHE = [
     '/',
     '/static/frontend/css/style.css',
@@ -24,19 +27,69 @@ self.addEventListener('activate', (event) => {
         caches.keys().then((cacheNames) => {
             return Promise.all(
                 cacheNames.map((cacheName) => {
-                    if (cacheName !== CACHE_NAME) {
+                    if (cacheName !== CACHE_NAME && cacheName !== BUNDLE_CACHE) {
                         return caches.delete(cacheName);
                     }
                 })
             );
-        })
+        }).then(refreshTimetableBundle)
     );
 });
 
+// Keep the latest timetable bundle for offline use.
+// Bundle URLs are content-hashed, so a cached one never needs revalidating;
+// only the manifest is fetched to learn whether a new one was published.
+function refreshTimetableBundle() {
+    return fetch(BUNDLE_MANIFEST)
+        .then((response) => response.ok ? response.json() : null)
+        .then((manifest) => {
+            if (!manifest) return;
+            return caches.open(BUNDLE_CACHE).then((cache) => {
+                return cache.match(manifest.url)
+                    .then((cached) => cached || cache.add(manifest.url))
+                    .then(() => cache.put(BUNDLE_MANIFEST, new Response(JSON.stringify(manifest), {
+                        headers: { 'Content-Type': 'application/json' }
+                    })))
+                    .then(() => cache.keys())
+                    .then((requests) => Promise.all(
+                        // Drop bundles older than the current one
+                        requests
+                            .filter((request) => {
+                                const path = new URL(request.url).pathname;
+                                return path !== manifest.url && path !== BUNDLE_MANIFEST;
+                            })
+                            .map((request) => cache.delete(request))
+                    ));
+            });
+        })
+        .catch(() => {
+            // Offline: keep whatever bundle is already cached
+        });
+}
+
 // Fetch event: Network first for API, Cache first for static
 self.addEventListener('fetch', (event) => {
     const url = new URL(event.request.url);
 
+    // Timetable bundle manifest: refresh the cached bundle in the background
+    if (url.pathname === BUNDLE_MANIFEST) {
+        event.waitUntil(refreshTimetableBundle());
+        event.respondWith(
+            fetch(event.request)
+                .catch(() => caches.match(BUNDLE_MANIFEST))
+        );
+        return;
+    }
+
+    // Timetable bundles: content-hashed, so cache first like static assets
+    if (url.pathname.startsWith(BUNDLE_FILES)) {
+        event.respondWith(
+            caches.match(event.request)
+                .then((response) => response || fetch(event.request))
+        );
+        return;
+    }
+
     // API requests: Network first, fall back to cache (if we implement API caching later)
     // For now, just network first for API to ensure fresh data
     if (url.pathname.startsWith('/api/')) {
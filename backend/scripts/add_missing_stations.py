@@ -8,6 +8,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Line
+from api.pipeline import finalize_import_report
 
 def add_missing_stations():
     """Add stations that were in the Excel but not in the database"""
@@ -90,6 +91,9 @@ def add_missing_stations():
     
     print(f"\n✅ Added {stations_added} new stations")
     print(f"📊 Total stations now: {Station.objects.count()}")
+    
+    # Publish a new dataset version so caches, ETags and the snapshot see the stations
+    finalize_import_report('add_missing_stations.py')
 
 if __name__ == "__main__":
     add_missing_stations()
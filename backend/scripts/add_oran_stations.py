@@ -8,6 +8,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Line
+from api.pipeline import finalize_import_report
 
 def add_oran_line_stations():
     """Add stations for the Alger-Oran intercity line"""
@@ -83,6 +84,9 @@ def add_oran_line_stations():
     print(f"\n✅ Added {stations_added} new stations")
     print(f"📊 Total stations now: {Station.objects.count()}")
     print(f"📊 Total routes now: {Route.objects.count()}")
+    
+    # Publish a new dataset version so caches, ETags and the snapshot see the stations
+    finalize_import_report('add_oran_stations.py')
 
 if __name__ == "__main__":
     add_oran_line_stations()
@@ -0,0 +1,333 @@
+"""
+Search benchmark on a synthetic SNTF-like network.
+
+Generates a network (lines sharing a trunk from Alger to El Harrach, each
+with its own branch, plus a disconnected shuttle), loads it with bulk
+inserts into a throwaway SQLite database (never the configured one), runs
+a fixed, seeded mix of direct, one-transfer and no-result searches through
+the search_schedule view and reports p50/p95/p99 latency, queries per
+search and peak memory. Results are saved as JSON; pass an earlier file to
+--compare to see the change between commits.
+
+    python scripts/benchmark.py --lines 12 --trains-per-hour 3 --compare before.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, time as dtime
+
+import django
+
+# Setup Django environment on a throwaway database
+BENCHMARK_DIR = tempfile.mkdtemp(prefix='traindz-benchmark-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(BENCHMARK_DIR, 'benchmark.sqlite3')}"
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory
+
+from api.models import Line, Station, Route, Train, Stop
+from api.pipeline import finalize_import
+from api.search_cache import get_search_cache
+from api.views import search_schedule
+
+TRUNK_ENDS = ('Alger', 'El Harrach')
+SERVICE_START = 5 * 60  # First departures from the terminals
+SERVICE_END = 21 * 60  # Last departures from the terminals
+OPERATING_DAYS = [('daily', 'Daily [*]', 0.8), ('no_friday', 'No Friday [1]', 0.15), ('friday_only', 'Friday Only [2]', 0.05)]
+KINDS = ('direct', 'transfer', 'none')
+
+
+def generate_network(lines, stations_per_line, trunk_stations, trains_per_hour, shuttle_stations, seed):
+    """
+    Plain description of a synthetic network: station names and, per line,
+    its station indexes and train departures. The same arguments always
+    give the same network.
+    """
+    rng = random.Random(seed)
+    stations = [TRUNK_ENDS[0]] + [f"Trunk {i}" for i in range(2, trunk_stations)] + [TRUNK_ENDS[1]]
+    trunk = list(range(len(stations)))
+
+    network_lines = []
+    for number in range(1, lines + 1):
+        branch = []
+        for i in range(1, stations_per_line + 1):
+            branch.append(len(stations))
+            stations.append(f"L{number} Station {i}")
+        network_lines.append({'name': f"Line {number}", 'code': f"L{number}", 'stations': trunk + branch,
+                              'branch': branch})
+    if shuttle_stations:
+        shuttle = []
+        for i in range(1, shuttle_stations + 1):
+            shuttle.append(len(stations))
+            stations.append(f"Shuttle {i}")
+        network_lines.append({'name': 'Shuttle', 'code': 'SH', 'stations': shuttle, 'branch': shuttle})
+
+    headway = 60 / trains_per_hour
+    for line in network_lines:
+        # Minutes between consecutive stations, fixed per line
+        line['hops'] = [rng.randint(2, 6) for _ in line['stations'][1:]]
+        line['trains'] = []
+        for direction in (1, -1):
+            departure = SERVICE_START + rng.randint(0, max(0, int(headway) - 1))
+            while departure <= SERVICE_END:
+                days = rng.choices(OPERATING_DAYS, weights=[weight for _, _, weight in OPERATING_DAYS])[0]
+                line['trains'].append({'direction': direction, 'departure': int(departure),
+                                       'operating_days': days[0], 'days_operational': days[1]})
+                departure += headway
+    return {'stations': stations, 'lines': network_lines}
+
+
+def load_network(network):
+    """Bulk insert a generated network; returns the Station rows in network order"""
+    stations = Station.objects.bulk_create(
+        Station(name_fr=name, name_ar=name) for name in network['stations']
+    )
+    train_rows = []
+    timetables = []
+    for line in network['lines']:
+        line_row = Line.objects.create(name=line['name'], code=line['code'])
+        Station.objects.filter(id__in=[stations[i].id for i in line['branch']]).update(line=line_row)
+        first, last = stations[line['stations'][0]], stations[line['stations'][-1]]
+        routes = {
+            1: Route.objects.create(line=line_row, origin=first, destination=last, name=f"{first.name_fr} - {last.name_fr}"),
+            -1: Route.objects.create(line=line_row, origin=last, destination=first, name=f"{last.name_fr} - {first.name_fr}"),
+        }
+        for number, train in enumerate(line['trains'], start=1):
+            train_rows.append(Train(
+                number=f"{line['code']}{number:03d}", route=routes[train['direction']],
+                operating_days=train['operating_days'], days_operational=train['days_operational'],
+            ))
+            timetables.append((line, train))
+    trains = Train.objects.bulk_create(train_rows, batch_size=1000)
+
+    stops = []
+    for train_row, (line, train) in zip(trains, timetables):
+        order = line['stations'] if train['direction'] == 1 else line['stations'][::-1]
+        hops = line['hops'] if train['direction'] == 1 else line['hops'][::-1]
+        minutes = train['departure']
+        for sequence, station in enumerate(order, start=1):
+            if sequence > 1:
+                minutes += hops[sequence - 2]
+            arrival = minutes if sequence > 1 else None
+            # Every stop has a departure time, as in the importers; the terminus departs on arrival
+            departure = minutes + 1 if sequence < len(order) else minutes
+            if sequence > 1 and sequence < len(order):
+                minutes += 1  # Dwell
+            stops.append(Stop(
+                train=train_row, station=stations[station], sequence=sequence,
+                arrival_time=None if arrival is None else dtime(arrival // 60 % 24, arrival % 60),
+                departure_time=dtime(departure // 60 % 24, departure % 60),
+            ))
+    Stop.objects.bulk_create(stops, batch_size=2000)
+    return stations
+
+
+def search_mix(network, stations, count, seed):
+    """Fixed list of (kind, query params): ``count`` direct, one-transfer and no-result searches"""
+    rng = random.Random(seed)
+    main_lines = [line for line in network['lines'] if line['code'] != 'SH']
+    shuttle = [line for line in network['lines'] if line['code'] == 'SH']
+
+    def query(from_index, to_index):
+        minutes = rng.randint(SERVICE_START, SERVICE_END - 60)
+        return {'from': stations[from_index].id, 'to': stations[to_index].id,
+                'time': f"{minutes // 60:02d}:{minutes % 60:02d}", 'day': rng.randint(0, 6)}
+
+    mix = []
+    for _ in range(count):
+        line = rng.choice(main_lines)
+        mix.append(('direct', query(*rng.sample(line['stations'], 2))))
+    if len(main_lines) >= 2:
+        for _ in range(count):
+            first, second = rng.sample(main_lines, 2)
+            mix.append(('transfer', query(rng.choice(first['branch']), rng.choice(second['branch']))))
+    if shuttle:
+        for _ in range(count):
+            pair = [rng.choice(shuttle[0]['stations']), rng.choice(rng.choice(main_lines)['stations'])]
+            rng.shuffle(pair)
+            mix.append(('none', query(*pair)))
+    return mix
+
+
+def run_search(factory, params, warm_cache):
+    """One search through search_schedule; returns (ms, queries, results)"""
+    if not warm_cache:
+        get_search_cache().clear()
+    queries = [0]
+
+    def count_query(execute, sql, query_params, many, context):
+        queries[0] += 1
+        return execute(sql, query_params, many, context)
+
+    request = factory.get('/api/search/', params)
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        response = search_schedule(request)
+        response.render()
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, queries[0], len(response.data) if response.status_code == 200 else 0
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+
+def summarize(samples):
+    latencies = [ms for ms, _, _ in samples]
+    queries = [count for _, count, _ in samples]
+    return {
+        'searches': len(samples),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'empty': sum(1 for _, _, results in samples if not results),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(previous, current):
+    print(f"\n📊 Compared with {previous.get('commit') or 'previous run'} ({previous.get('timestamp')}):")
+    for kind, stats in current['results'].items():
+        old = previous.get('results', {}).get(kind)
+        if not old:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean'):
+            delta = f" ({(stats[key] - old[key]) / old[key] * 100:+.1f}%)" if old[key] else ''
+            changes.append(f"{key} {old[key]} → {stats[key]}{delta}")
+        print(f"   {kind}: " + ', '.join(changes))
+
+
+def run_benchmark(args):
+    print("=" * 60)
+    print("  SNTF Search Benchmark")
+    print("=" * 60)
+
+    # Derived artifacts of the throwaway dataset stay in the throwaway directory
+    settings.TIMETABLE_BUNDLE_ROOT = os.path.join(BENCHMARK_DIR, 'bundles')
+    call_command('migrate', verbosity=0)
+
+    # 1. Generate and load the network
+    print(f"\n🏗️  Generating network: {args.lines} lines x {args.stations_per_line} stations, "
+          f"{args.trunk_stations} trunk stations, {args.trains_per_hour} trains/hour (seed {args.seed})")
+    network = generate_network(args.lines, args.stations_per_line, args.trunk_stations,
+                               args.trains_per_hour, args.shuttle_stations, args.seed)
+    start = time.perf_counter()
+    stations = load_network(network)
+    summary = finalize_import('benchmark.py')
+    load_seconds = time.perf_counter() - start
+    network_stats = {
+        'stations': Station.objects.count(),
+        'trains': Train.objects.count(),
+        'stops': Stop.objects.count(),
+        'segments': summary['segments'],
+        'connections': summary['connections'],
+    }
+    print(f"   ✅ Loaded in {load_seconds:.2f}s: " + ', '.join(f"{count} {name}" for name, count in network_stats.items()))
+
+    # 2. Searches
+    mix = search_mix(network, stations, args.searches, args.seed)
+    factory = RequestFactory()
+    print(f"\n🔍 Running {len(mix)} searches x {args.repeat} (search cache {'warm' if args.warm_cache else 'cleared'})...")
+    warmup_ms = run_search(factory, mix[0][1], args.warm_cache)[0]
+    samples = {kind: [] for kind in KINDS}
+    for _ in range(args.repeat):
+        for kind, params in mix:
+            samples[kind].append(run_search(factory, params, args.warm_cache))
+
+    # 3. Memory: peak allocation of each search, in a separate traced pass
+    tracemalloc.start()
+    peak_search_kb = 0.0
+    for _, params in mix:
+        tracemalloc.reset_peak()
+        run_search(factory, params, args.warm_cache)
+        peak_search_kb = max(peak_search_kb, tracemalloc.get_traced_memory()[1] / 1024)
+    tracemalloc.stop()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'settings': {'timetable_snapshot': settings.TIMETABLE_SNAPSHOT, 'warm_cache': args.warm_cache,
+                     'repeat': args.repeat},
+        'network': {
+            'lines': args.lines, 'stations_per_line': args.stations_per_line, 'trunk_stations': args.trunk_stations,
+            'trains_per_hour': args.trains_per_hour, 'shuttle_stations': args.shuttle_stations, 'seed': args.seed,
+            **network_stats,
+        },
+        'load_seconds': round(load_seconds, 3),
+        'warmup_ms': round(warmup_ms, 3),
+        'results': {kind: summarize(kind_samples) for kind, kind_samples in samples.items() if kind_samples},
+        'peak_search_kb': round(peak_search_kb, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    results['results']['all'] = summarize([sample for kind_samples in samples.values() for sample in kind_samples])
+
+    # 4. Report
+    print(f"   First search (builds the timetable snapshot): {warmup_ms:.1f}ms")
+    for kind, stats in results['results'].items():
+        print(f"   {kind:>8}: p50 {stats['p50_ms']:.2f}ms  p95 {stats['p95_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms  "
+              f"queries {stats['queries_mean']} (max {stats['queries_max']})  empty {stats['empty']}/{stats['searches']}")
+    print(f"   Peak memory: {results['peak_search_kb']} KB per search, {results['peak_rss_mb']} MB process RSS")
+
+    output = args.output or f"benchmark_{results['commit'] or 'local'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark searches on a synthetic network.')
+    parser.add_argument('--lines', type=int, default=6, help='lines sharing the trunk')
+    parser.add_argument('--stations-per-line', type=int, default=15, help='branch stations of each line')
+    parser.add_argument('--trunk-stations', type=int, default=6, help='shared stations from Alger to El Harrach (at least 2)')
+    parser.add_argument('--trains-per-hour', type=float, default=2, help='trains per hour and direction on each line')
+    parser.add_argument('--shuttle-stations', type=int, default=4, help='stations of the disconnected shuttle (0 for none)')
+    parser.add_argument('--searches', type=int, default=50, help='searches of each kind')
+    parser.add_argument('--repeat', type=int, default=3, help='times the search mix is run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--warm-cache', action='store_true', help='keep the search cache between searches')
+    parser.add_argument('--output', help='JSON results file (default benchmark_<commit>_<time>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare with')
+    args = parser.parse_args()
+    if args.trunk_stations < 2 or args.lines < 1 or args.stations_per_line < 1 or args.trains_per_hour <= 0:
+        parser.error('needs at least 2 trunk stations, 1 line, 1 station per line and some trains')
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        run_benchmark(parse_args())
+    finally:
+        connection.close()
+        shutil.rmtree(BENCHMARK_DIR, ignore_errors=True)
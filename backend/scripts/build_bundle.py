@@ -0,0 +1,25 @@
+import os
+import sys
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
+django.setup()
+
+from api.bundle import write_bundle, get_bundle_root
+
+def build_bundle():
+    print("📦 Compiling timetable bundle...")
+    manifest = write_bundle()
+
+    print(f"✅ Bundle written to {get_bundle_root()}")
+    print(f"   URL: {manifest['url']}")
+    print(f"   Dataset version: {manifest['version']}")
+    print(f"   Size: {manifest['size']} bytes")
+    print(f"   Gzip: {manifest['gzip_size']} bytes")
+    if 'brotli_size' in manifest:
+        print(f"   Brotli: {manifest['brotli_size']} bytes")
+
+if __name__ == "__main__":
+    build_bundle()
@@ -8,6 +8,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop, Line
+from api.pipeline import finalize_import_report
 
 def import_structured_data():
     print("Importing structured timetable data...")
@@ -229,6 +230,8 @@ def import_structured_data():
                     sequence=seq
                 )
     
+    finalize_import_report('import_data.py')
+    
     print(f"\n✅ Import complete!")
     print(f"   Stations: {Station.objects.count()}")
     print(f"   Lines: {Line.objects.count()}")
@@ -10,45 +10,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop, Line
-
-# Station name normalization mapping
-STATION_NAME_MAPPING = {
-    # Variations with hyphens
-    'El-Harrach': 'El Harrach',
-    'Oued-Smar': 'Oued Smar',
-    'Bab-Ezzouar': 'Bab Ezzouar',
-    'Dar-El-Beida': 'Dar El Beida',
-    'Dar El-Beida': 'Dar El Beida',
-    'Dar El Beïda': 'Dar El Beida',
-    'Rouiba-Ind': 'Rouiba Ind',
-    'Rouiba-SNVI': 'Rouiba SNVI',
-    'Reghaia-Ind': 'Reghaia Ind',
-    'Gué-de-Constantine': 'Gué de Constantine',
-    'Ain-Naadja': 'Ain Naadja',
-    'Baba-Ali': 'Baba Ali',
-    'Beni-Mered': 'Beni Mered',
-    'Tessala-El-Merdja': 'Tessala El Merdja',
-    'Sidi-Abdelah': 'Sidi Abdelah',
-    'Aeroport-Houari-Boumediene': 'Aeroport Houari Boumediene',
-    # Special characters (accents)
-    'Thénia': 'Thenia',
-    'Boumerdès': 'Boumerdes',
-    'Réghaïa': 'Reghaia',
-    # Abbreviations (these now exist as separate stations)
-    # 'B.Mered' is kept separate
-    # 'Gué de Cne' is kept separate
-    'H.Dey': 'Hussein Dey',
-    'Sidi Abde allah': 'Sidi Abdelah',
-    'Sidi Abde allah-U': 'Sidi Abdelah-U',
-}
-
-
-def normalize_station_name(name):
-    """Normalize station name to canonical form"""
-    if not name:
-        return None
-    name = ' '.join(name.split())
-    return STATION_NAME_MAPPING.get(name, name)
+from api.pipeline import finalize_import_report
+from api.station_names import normalize_station_name
 
 def time_to_string(time_value):
     """Convert time value to HH:MM string"""
@@ -266,6 +229,8 @@ def import_excel_trains(file_path):
                 print(f"      ⚠️  No stops added for train {train_number}")
                 skipped_count += 1
     
+    finalize_import_report('import_from_excel.py')
+    
     print(f"\n✅ Import complete!")
     print(f"   Imported: {imported_count} trains")
     print(f"   Skipped: {skipped_count} trains")
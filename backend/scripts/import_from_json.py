@@ -9,6 +9,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop, Line
+from api.pipeline import finalize_import_report
 
 def import_from_json(json_file_path):
     """Import train data from the manual JSON file"""
@@ -105,6 +106,8 @@ def import_from_json(json_file_path):
         print(f"   ✅ Added {stops_created} stops to train {train_number}")
         imported_count += 1
     
+    finalize_import_report('import_from_json.py')
+    
     print(f"\n✅ Import complete!")
     print(f"   Imported: {imported_count} trains")
     print(f"   Skipped: {skipped_count} trains")
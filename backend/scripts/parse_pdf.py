@@ -10,6 +10,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop, Line
+from api.pipeline import finalize_import_report
 
 def parse_pdf():
     print("Extracting text from PDF...")
@@ -118,6 +119,8 @@ def parse_pdf():
                     defaults={'departure_time': time_str}
                 )
     
+    finalize_import_report('parse_pdf.py')
+    
     print(f"Created {Train.objects.count()} trains")
 
 if __name__ == "__main__":
@@ -10,39 +10,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop, Line, Connection
-
-# Station name normalization mapping
-STATION_NAME_MAPPING = {
-    'El-Harrach': 'El Harrach',
-    'Oued-Smar': 'Oued Smar',
-    'Bab-Ezzouar': 'Bab Ezzouar',
-    'Dar-El-Beida': 'Dar El Beida',
-    'Dar El-Beida': 'Dar El Beida',
-    'Dar El Beïda': 'Dar El Beida',
-    'Rouiba-Ind': 'Rouiba Ind',
-    'Rouiba-SNVI': 'Rouiba SNVI',
-    'Reghaia-Ind': 'Reghaia Ind',
-    'Gué-de-Constantine': 'Gué de Constantine',
-    'Ain-Naadja': 'Ain Naadja',
-    'Baba-Ali': 'Baba Ali',
-    'Beni-Mered': 'Beni Mered',
-    'Tessala-El-Merdja': 'Tessala El Merdja',
-    'Sidi-Abdelah': 'Sidi Abdelah',
-    'Aeroport-Houari-Boumediene': 'Aeroport Houari Boumediene',
-    'Thénia': 'Thenia',
-    'Boumerdès': 'Boumerdes',
-    'Réghaïa': 'Reghaia',
-    'H.Dey': 'Hussein Dey',
-    'Sidi Abde allah': 'Sidi Abdelah',
-    'Sidi Abde allah-U': 'Sidi Abdelah-U',
-}
-
-def normalize_station_name(name):
-    """Normalize station name to canonical form"""
-    if not name:
-        return None
-    name = ' '.join(name.split())
-    return STATION_NAME_MAPPING.get(name, name)
+from api.pipeline import finalize_import_report
+from api.station_names import normalize_station_name
 
 def time_to_string(time_value):
     """Convert time value to HH:MM string"""
@@ -265,6 +234,8 @@ def update_database(file_path):
                 skipped_count += 1
                 current_train.delete() # Cleanup empty train
 
+    finalize_import_report('update_db.py')
+    
     print(f"\n✅ Update complete!")
     print(f"   Imported: {imported_count} trains")
     print(f"   Skipped: {skipped_count} trains")
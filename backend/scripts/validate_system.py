@@ -10,7 +10,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sntf_project.settings")
 django.setup()
 
 from api.models import Station, Route, Train, Stop
-from api.views import find_direct_trains, find_connection_trains
+from api.views import current_timetable, find_direct_trains, find_connection_trains
 
 def run_validation():
     print("=" * 60)
@@ -52,10 +52,11 @@ def run_validation():
         alger = Station.objects.get(name_fr='Alger')
         thenia = Station.objects.get(name_fr='Thenia')
         zeralda = Station.objects.get(name_fr='Zéralda')
+        timetable = current_timetable()
         
         # Test Direct: Alger -> Thenia
         start_time = time.time()
-        direct_results = find_direct_trains(alger, thenia)
+        direct_results = find_direct_trains(timetable, alger, thenia)
         duration = (time.time() - start_time) * 1000
         
         if direct_results:
@@ -65,7 +66,7 @@ def run_validation():
             
         # Test Connection: Thenia -> Zeralda (via Alger)
         start_time = time.time()
-        conn_results = find_connection_trains(thenia, zeralda)
+        conn_results = find_connection_trains(timetable, thenia, zeralda)
         duration = (time.time() - start_time) * 1000
         
         if conn_results:
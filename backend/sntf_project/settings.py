@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.metrics.MetricsMiddleware",
+    "api.profiling.RequestProfilingMiddleware",
     # "whitenoise.middleware.WhiteNoiseMiddleware", # Moved to conditional below
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -133,7 +135,76 @@ STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 
+# Precompiled timetable bundles (api.bundle), written by scripts/build_bundle.py
+# at build time and by every import. They are served by /api/timetable/bundles/
+# (not WhiteNoise, which only sees the files present when the server starts),
+# with a far-future immutable Cache-Control since their names carry a content
+# hash. Kept out of STATIC_ROOT so collectstatic --clear does not delete them.
+TIMETABLE_BUNDLE_ROOT = BASE_DIR / "bundles"
+TIMETABLE_BUNDLE_URL = "/api/timetable/bundles/"
+# Dataset versions whose change log (api.changes) is kept for delta sync;
+# clients further behind get a full resync marker
+TIMETABLE_CHANGE_RETENTION = int(os.environ.get('TIMETABLE_CHANGE_RETENTION', 30))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Journey search
+# Minimum time (in minutes) a passenger needs to change trains
+MIN_TRANSFER_MINUTES = int(os.environ.get('MIN_TRANSFER_MINUTES', 10))
+# Serve searches from the in-process timetable snapshot (api.timetable).
+# Set to False to query the TripSegment index instead, e.g. on short-lived
+# serverless workers where building the snapshot per process doesn't pay off.
+# No snapshot is then built at all, so the algorithms that need one are off:
+# searches return direct and one-transfer journeys only (no Connection Scan
+# fallback), mode=pareto and /api/reachability/ answer 501, and
+# /api/search/journey/ loads just the journey's trains.
+TIMETABLE_SNAPSHOT = os.environ.get('TIMETABLE_SNAPSHOT', 'True') == 'True'
+
+# Search result cache
+# Results are keyed on the dataset version (api.dataset), so an import
+# invalidates them; the local-memory backend evicts least recently used
+# entries beyond MAX_ENTRIES. Point 'search' at Redis/Memcached to share it.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "search": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sntf-search",
+        "TIMEOUT": int(os.environ.get('SEARCH_CACHE_TIMEOUT', 3600)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+# Requested departure times are rounded down to this many minutes
+SEARCH_CACHE_TIME_BUCKET = int(os.environ.get('SEARCH_CACHE_TIME_BUCKET', 5))
+# Seconds a worker reuses its last dataset version lookup before checking again
+DATASET_VERSION_TTL = int(os.environ.get('DATASET_VERSION_TTL', 5))
+# Worker threads for /api/search/batch/ requests with "parallel": true
+SEARCH_BATCH_WORKERS = int(os.environ.get('SEARCH_BATCH_WORKERS', 4))
+
+# Request profiling (api.profiling): fraction of requests timed per phase and
+# reported in a Server-Timing header and an 'api.profiling' log line
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0.0))
+
+# Prometheus metrics (api.metrics, GET /metrics). Under several gunicorn
+# workers, point METRICS_MULTIPROCESS_DIR at a directory shared by them (and
+# emptied at startup) so /metrics reports all workers, not just the one
+# answering; each worker writes its values there every METRICS_FLUSH_INTERVAL seconds
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR', '')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.profiling": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
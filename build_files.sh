@@ -5,4 +5,7 @@ python3 -m pip install -r requirements.txt
 echo "Collecting static files..."
 python3 backend/manage.py collectstatic --noinput --clear
 
+echo "Building timetable bundle..."
+python3 backend/scripts/build_bundle.py
+
 echo "Build complete!"